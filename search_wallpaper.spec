@@ -17,6 +17,7 @@ a = Analysis(
         'requests.adapters',
         'PIL',
         'PIL.Image',
+        'numpy',
         'selenium',
         'selenium.webdriver',
         'webdriver_manager',
@@ -11,12 +11,13 @@ import os
 # Fix för WebDriver Manager SSL-problem
 os.environ['WDM_SSL_VERIFY'] = '0'
 
-import random
 import json
 import logging
 import time
 import subprocess
-from typing import Optional, Tuple, Dict
+import threading
+from typing import Iterator, Optional
+from urllib.parse import quote_plus
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -26,17 +27,39 @@ from selenium.webdriver.edge.options import Options
 from selenium.webdriver.edge.service import Service as EdgeService
 from webdriver_manager.microsoft import EdgeChromiumDriverManager
 
-import requests
-from PIL import Image
-from io import BytesIO
 import tkinter as tk
 from tkinter import messagebox
 
 from utils.paths import get_app_paths
-from config.search_config import load_search_queries
+from utils.rate_limit import SearchRateLimiter
+from api.candidates import ImageCandidate, parse_bing_payload
+from api.provider import ImageProvider, SearchCancelled
+from config.app_config import load_app_config
 
 logger = logging.getLogger(__name__)
 
+# Resurser som inte behövs för att läsa ut bilddata ur resultatsidan.
+# Blockeras via CDP (Network.setBlockedURLs) så att sidan laddas utan miniatyrer,
+# media och typsnitt.
+BLOCKED_URL_PATTERNS = [
+    '*.jpg', '*.jpeg', '*.png', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico',
+    '*.mp4', '*.webm', '*.m3u8', '*.mp3',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*/th?id=*', '*/th/id/*',  # Bings miniatyrbilder saknar filändelse
+]
+
+# Läser ut m-attributet och storleks-/formatrutan ("1920 x 1080 · jpeg") från
+# alla bildcontainers i ett enda WebDriver-anrop
+EXTRACT_PAYLOADS_SCRIPT = """
+var limit = arguments[0];
+var elements = Array.prototype.slice.call(document.querySelectorAll('.iusc'), 0, limit);
+return JSON.stringify(elements.map(function (e) {
+    var box = e.closest('.imgpt');
+    var info = box ? box.querySelector('.img_info span.nowrap, .img_info') : null;
+    return {m: e.getAttribute('m'), info: info ? info.textContent : ''};
+}));
+"""
+
 
 def get_edge_driver_service() -> EdgeService:
     """
@@ -64,30 +87,31 @@ def get_edge_driver_service() -> EdgeService:
     return service
 
 
-class BingScraper:
-    """Klass för att hämta bilder från Bing via Selenium (headless Edge)."""
+class BingScraper(ImageProvider):
+    """Bildkälla som söker på Bing Images via Selenium (headless Edge)."""
 
+    name = 'bing'
     BASE_URL = "https://www.bing.com/images/search"
 
     def __init__(self, status_window=None):
         self.status_window = status_window
 
-        # Hämta söktermer från konfiguration
-        self.search_queries, self.excluded_words = load_search_queries()
-
         # Hämta alla sökvägar
         self.paths = get_app_paths()
 
-        # Skapa mappar om de inte finns
-        os.makedirs(self.paths['cache_dir'], exist_ok=True)
-
-        # Ladda historik och räknare
-        self.history = self._load_history()
-        self.daily_search_count = self._load_daily_search_count()
+        # Sökbudgeten gäller Bing och delas mellan samtidiga processer
+        settings = load_app_config()
+        self.rate_limiter = SearchRateLimiter(
+            self.paths['daily_count_file'],
+            per_day=settings.getint('Limits', 'searches_per_day'),
+            per_minute=settings.getint('Limits', 'searches_per_minute'),
+        )
 
         # Headless-läge med robust fallback + "osynliga" fönsterinställningar
         self.headless_mode = "new"  # "new" eller "classic"
         self.edge_options = self._build_edge_options(self.headless_mode)
+        self.used_headless_fallback = False
+        self._driver = None
 
     # --- Hjälpmetoder för konfiguration och state ---
 
@@ -125,6 +149,13 @@ class BingScraper:
         opts.add_argument('--start-minimized')
         opts.add_argument('--window-position=-32000,-32000')
 
+        # Vänta bara in DOM:en (DOMContentLoaded), inte bilder/skript som laddas efteråt
+        opts.page_load_strategy = 'eager'
+        # Ladda inga bilder även om CDP-blockeringen inte skulle gå att aktivera
+        opts.add_experimental_option('prefs', {
+            'profile.managed_default_content_settings.images': 2,
+        })
+
         # Mindre "Selenium is controlled" brus
         try:
             opts.add_experimental_option("excludeSwitches", ["enable-automation", "enable-logging"])
@@ -134,228 +165,159 @@ class BingScraper:
 
         return opts
 
-    def _load_history(self) -> list:
-        """Läser in historiken över tidigare använda bilder."""
-        if os.path.exists(self.paths['history_file']):
-            with open(self.paths['history_file'], "r", encoding="utf-8") as file:
-                try:
-                    return json.load(file)
-                except json.JSONDecodeError:
-                    return []
-        return []
-
-    def _save_history(self):
-        """Sparar historiken till fil (max 50 senaste)."""
-        with open(self.paths['history_file'], "w", encoding="utf-8") as file:
-            json.dump(self.history[-50:], file, ensure_ascii=False)
-
-    def _load_daily_search_count(self) -> Dict:
-        """Läser in dagens sökräknare."""
-        if os.path.exists(self.paths['daily_count_file']):
-            with open(self.paths['daily_count_file'], "r", encoding="utf-8") as file:
-                try:
-                    data = json.load(file)
-                    if data.get("date") != time.strftime("%Y-%m-%d"):
-                        return {"date": time.strftime("%Y-%m-%d"), "count": 0}
-                    return data
-                except json.JSONDecodeError:
-                    pass
-        return {"date": time.strftime("%Y-%m-%d"), "count": 0}
-
-    def _save_daily_search_count(self):
-        """Sparar dagens sökräknare."""
-        with open(self.paths['daily_count_file'], "w", encoding="utf-8") as file:
-            json.dump(self.daily_search_count, file, ensure_ascii=False)
-
-    def _increment_search_count(self) -> bool:
-        """Ökar sökräknaren och kontrollerar gränsen (50/dag)."""
-        if self.daily_search_count["count"] >= 50:
-            logger.warning("Daglig sökgräns uppnådd")
-            return False
-        self.daily_search_count["count"] += 1
-        self._save_daily_search_count()
-        return True
-
-    def _verify_image_dimensions(self, image_url: str) -> bool:
-        """Verifierar att bilden uppfyller dimensionskraven (min 1920x1080 och landskap)."""
-        try:
-            session = requests.Session()
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0',
-                'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            }
-
-            response = session.get(image_url, headers=headers, timeout=15, stream=True)
-            response.raise_for_status()
-
-            img = Image.open(BytesIO(response.content))
-            width, height = img.size
-
-            if width < 1920 or height < 1080:
-                logger.info(f"Bild för liten: {width}x{height}")
-                return False
+    def _increment_search_count(self):
+        """Förbrukar en sökning ur dygns- och minutbudgeten (RateLimitExceeded om den är slut)."""
+        self.rate_limiter.acquire()
 
-            if width < height:
-                logger.info("Bild i porträttläge")
-                return False
+    def _block_heavy_resources(self, driver):
+        """Blockerar bilder, media och typsnitt via CDP innan sidan laddas."""
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+        except Exception as e:
+            logger.warning(f"Kunde inte blockera resurser via CDP: {e}")
 
-            return True
+    def _extract_payloads(self, driver, limit: int) -> list:
+        """
+        Hämtar m-attribut och info-text för de första `limit` bildcontainerna i ett anrop.
 
-        except Exception as e:
-            logger.error(f"Fel vid verifiering av bild: {str(e)}")
-            return False
+        Returns:
+            list: Lista med (m-json, info-text)
+        """
+        raw = driver.execute_script(EXTRACT_PAYLOADS_SCRIPT, limit)
+        return [(item['m'], item.get('info') or '') for item in json.loads(raw or '[]') if item.get('m')]
 
     def _update_status(self, message):
         """Uppdaterar status om status_window finns."""
         if self.status_window:
             self.status_window.update_status(message)
 
-    # --- Huvudflöde ---
-
-    def get_random_image(self) -> Optional[Tuple[str, Dict]]:
+    def _start_driver(self):
         """
-        Hämtar en slumpmässig bild från Bing.
-        Kör Edge i headless-läge och undviker att öppna ett synligt Edge-fönster.
+        Startar Edge WebDriver i headless-läge.
         Faller tillbaka från '--headless=new' till klassiska '--headless' om det behövs.
         OBS: Vi kör inte msedge.exe manuellt någonstans (ingen versionscheck) för att undvika UI-triggers.
         """
-        if not self._increment_search_count():
-            return None
-
-        driver = None
-        max_retries = 3
-        used_headless_fallback = False
+        self._update_status("Startar webbläsare...")
+        logger.info("Startar Edge WebDriver...")
+        service = get_edge_driver_service()
 
-        for attempt in range(max_retries):
+        try:
+            driver = webdriver.Edge(service=service, options=self.edge_options)
+            # Verifiera att WebDriver fungerar
+            driver.execute_script("return navigator.userAgent;")
+            logger.info("Edge WebDriver startad framgångsrikt i headless-läge")
+            return driver
+        except Exception as start_error:
+            # Om modern headless inte stöds, fall tillbaka till klassisk headless en gång
+            if self.headless_mode != "new" or self.used_headless_fallback:
+                raise
+            logger.warning(f"Start i '--headless=new' misslyckades: {start_error}")
+            logger.info("Försöker igen med klassiska '--headless'...")
+            self.used_headless_fallback = True
+            self.headless_mode = "classic"
+            self.edge_options = self._build_edge_options(self.headless_mode)
+            time.sleep(1)
+            driver = webdriver.Edge(service=service, options=self.edge_options)
+            driver.execute_script("return navigator.userAgent;")
+            logger.info("Edge WebDriver startad med klassiska '--headless'")
+            return driver
+
+    @staticmethod
+    def _quit_driver(driver):
+        """Stänger webbläsaren, med forcerad stängning som reserv."""
+        try:
+            driver.quit()
+        except Exception:
+            # Om quit() misslyckas, försök forcera stängning
             try:
-                query = random.choice(self.search_queries)
-                search_url = f"{self.BASE_URL}?q={query}&qft=+filterui:aspect-wide+filterui:imagesize-wallpaper&first=1"
-
-                # Starta WebDriver headless
-                self._update_status("Startar webbläsare...")
-                logger.info(f"Försök {attempt + 1}/{max_retries} - Startar Edge WebDriver...")
-
-                service = get_edge_driver_service()
-
-                try:
-                    driver = webdriver.Edge(service=service, options=self.edge_options)
-                    # Verifiera att WebDriver fungerar
-                    driver.execute_script("return navigator.userAgent;")
-                    logger.info("Edge WebDriver startad framgångsrikt i headless-läge")
-                except Exception as start_error:
-                    # Om modern headless inte stöds, fall tillbaka till klassisk headless en gång
-                    if self.headless_mode == "new" and not used_headless_fallback:
-                        logger.warning(f"Start i '--headless=new' misslyckades: {start_error}")
-                        logger.info("Försöker igen med klassiska '--headless'...")
-                        used_headless_fallback = True
-                        self.headless_mode = "classic"
-                        self.edge_options = self._build_edge_options(self.headless_mode)
-                        # Försök igen direkt i samma försök
-                        if driver:
-                            try:
-                                driver.quit()
-                            except Exception:
-                                pass
-                        time.sleep(1)
-                        driver = webdriver.Edge(service=service, options=self.edge_options)
-                        driver.execute_script("return navigator.userAgent;")
-                        logger.info("Edge WebDriver startad med klassiska '--headless'")
-                    else:
-                        raise
-
-                logger.info(f"Söker efter: {query}")
-                self._update_status(f"Söker efter bilder med temat: {query}")
-
-                # Navigera till Bing Images med timeout
-                driver.set_page_load_timeout(30)
-                driver.get(search_url)
-
-                # Vänta på att bilderna ska laddas
-                WebDriverWait(driver, 20).until(
-                    EC.presence_of_element_located((By.CLASS_NAME, "iusc"))
-                )
-
-                # Hitta alla bildcontainers
-                image_elements = driver.find_elements(By.CLASS_NAME, "iusc")
-
-                if not image_elements:
-                    logger.warning("Inga bilder hittades")
-                    if driver:
-                        driver.quit()
-                    return None
-
-                # Filtrera och processa bilderna
-                self._update_status("Analyserar bilder...")
-                valid_images = []
-                for element in image_elements[:12]:  # Begränsa för snabbhet/stabilitet
-                    try:
-                        image_data = json.loads(element.get_attribute('m'))
-                        image_url = image_data.get('murl', '')
-
-                        if (
-                            image_url
-                            and image_url not in self.history
-                            and not any(word in image_url.lower() for word in self.excluded_words)
-                        ):
-                            if self._verify_image_dimensions(image_url):
-                                valid_images.append((image_url, image_data))
-                                logger.info(f"Giltig bild hittad: {image_url}")
-
-                    except Exception as e:
-                        logger.error(f"Fel vid processering av bild: {str(e)}")
-                        continue
-
-                if not valid_images:
-                    logger.warning("Inga giltiga bilder hittades")
-                    if driver:
-                        driver.quit()
-                    return None
-
-                # Välj en slumpmässig bild
-                self._update_status("Väljer bild...")
-                selected_url, metadata = random.choice(valid_images)
-
-                # Uppdatera historik
-                self.history.append(selected_url)
-                self._save_history()
-
-                if driver:
-                    try:
-                        driver.quit()
-                    except Exception:
-                        # Om quit() misslyckas, försök forcera stängning
-                        try:
-                            driver.close()
-                            driver.quit()
-                        except Exception:
-                            pass
-
-                return selected_url, {"source": "Bing Images", "query": query}
+                driver.close()
+                driver.quit()
+            except Exception:
+                pass
 
+    def _load_results_page(self, search_url: str, query: str, limit: int,
+                           stop_event: Optional[threading.Event] = None) -> list:
+        """
+        Laddar Bings resultatsida i Edge och läser ut bilddatan.
+        Förbrukar en token ur sökbudgeten; kastar RateLimitExceeded om budgeten är slut.
+        Kastar SearchCancelled om sökningen avbryts medan webbläsaren startar.
+        """
+        if stop_event is not None and stop_event.is_set():
+            raise SearchCancelled("sökningen avbröts innan webbläsaren startade")
+        self._increment_search_count()
+
+        driver = self._driver = self._start_driver()
+        try:
+            # close() kan ha anropats medan webbläsaren startade, innan _driver var satt
+            if stop_event is not None and stop_event.is_set():
+                raise SearchCancelled("sökningen avbröts medan webbläsaren startade")
+            logger.info(f"Söker efter: {query}")
+            self._update_status(f"Söker efter bilder med temat: {query}")
+
+            # Navigera till Bing Images med timeout
+            self._block_heavy_resources(driver)
+            driver.set_page_load_timeout(30)
+            load_started = time.perf_counter()
+            driver.get(search_url)
+
+            # Vänta på att bilderna ska laddas
+            WebDriverWait(driver, 20).until(
+                EC.presence_of_element_located((By.CLASS_NAME, "iusc"))
+            )
+            load_time = time.perf_counter() - load_started
+
+            # Läs ut bilddata från alla bildcontainers i ett anrop
+            extract_started = time.perf_counter()
+            payloads = self._extract_payloads(driver, limit)
+            logger.info(
+                f"Sidladdning {load_time:.2f} s, utläsning av {len(payloads)} "
+                f"bilder {time.perf_counter() - extract_started:.3f} s"
+            )
+            return payloads
+        finally:
+            self._driver = None
+            self._quit_driver(driver)
+
+    # --- Huvudflöde ---
+
+    def search(self, query: str, limit: int = 12,
+               stop_event: Optional[threading.Event] = None) -> Iterator[ImageCandidate]:
+        """
+        Söker på Bing Images och levererar kandidater från resultatsidan.
+        Varje sökning som inte kan besvaras från cachen förbrukar en token ur sökbudgeten;
+        är budgeten slut kastas RateLimitExceeded så att anroparen kan vänta eller ge upp.
+        """
+        search_url = (
+            f"{self.BASE_URL}?q={quote_plus(query)}"
+            f"&qft=+filterui:aspect-wide+filterui:imagesize-wallpaper&first=1"
+        )
+
+        # Färska resultat för samma sökning kostar varken webbläsare eller sökbudget
+        payloads = self._load_cached_results(search_url)
+        if payloads is None:
+            payloads = self._load_results_page(search_url, query, limit, stop_event)
+            self._store_results(search_url, payloads)
+
+        if not payloads:
+            logger.warning("Inga bilder hittades")
+
+        for payload, info_text in payloads:
+            if stop_event is not None and stop_event.is_set():
+                return
+            try:
+                candidate = parse_bing_payload(payload, info_text, query)
             except Exception as e:
-                logger.error(f"Försök {attempt + 1} - Fel vid bildsökning: {str(e)}")
-
-                if driver:
-                    try:
-                        driver.quit()
-                    except Exception:
-                        pass
-                    driver = None
-
-                # Om det inte är sista försöket, försök igen
-                if attempt < max_retries - 1:
-                    self._update_status("Försöker igen...")
-                    time.sleep(3)
-                    continue
-                else:
-                    logger.error(f"Alla {max_retries} försök misslyckades")
-                    return None
-
-        return None
+                logger.error(f"Fel vid tolkning av Bing-resultat: {str(e)}")
+                continue
+            if candidate:
+                yield candidate
+
+    def close(self):
+        """Stänger en pågående webbläsarsession (anropas när sökningen avbryts)."""
+        driver = self._driver
+        if driver:
+            self._quit_driver(driver)
 
     def _show_edge_error(self, message):
         """Visar felmeddelande för Edge-problem."""
@@ -366,16 +328,3 @@ class BingScraper:
             root.destroy()
         except Exception:
             logger.error(f"Edge-fel: {message}")
-
-    def get_cached_image(self) -> Optional[str]:
-        """Returnerar en slumpmässig bild från cachen om tillgänglig."""
-        try:
-            cached_files = [
-                f for f in os.listdir(self.paths['cache_dir'])
-                if f.lower().endswith(('.jpg', '.jpeg', '.png'))
-            ]
-            if cached_files:
-                return os.path.join(self.paths['cache_dir'], random.choice(cached_files))
-        except Exception as e:
-            logger.error(f"Fel vid hämtning från cache: {str(e)}")
-        return None
@@ -0,0 +1,120 @@
+"""
+Bildkandidater från sökresultat och förfiltrering på metadata.
+Bings resultat innehåller redan miniatyr-URL, sidtitel och ofta storlek och
+filformat. Kandidater som med säkerhet inte kan godkännas sorteras bort här,
+innan någon nätverksförfrågan görs mot bilden.
+"""
+
+import re
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+MIN_WIDTH = 1920
+MIN_HEIGHT = 1080
+
+# Format som kan användas som bakgrundsbild
+ALLOWED_FILE_TYPES = {'jpg', 'jpeg', 'png', 'webp', 'bmp'}
+FILE_TYPE_ALIASES = {'jpe': 'jpeg', 'jfif': 'jpeg', 'svg+xml': 'svg', 'tif': 'tiff'}
+
+# "1920 x 1080 · jpeg" i Bings img_info-ruta
+SIZE_PATTERN = re.compile(r'(\d{2,5})\s*[x×]\s*(\d{2,5})')
+TYPE_PATTERN = re.compile(r'·\s*([A-Za-z+]{2,8})')
+
+
+@dataclass
+class ImageCandidate:
+    """En bild från en sökkälla, med den metadata källan redan har lämnat."""
+
+    url: str
+    source: str
+    query: str = ''
+    thumbnail_url: str = ''
+    title: str = ''
+    page_url: str = ''
+    width: Optional[int] = None
+    height: Optional[int] = None
+    file_type: Optional[str] = None
+    metadata: Dict = field(default_factory=dict)
+
+
+def normalize_file_type(value: Optional[str]) -> Optional[str]:
+    """Normaliserar 'JPEG', 'image/jpeg', '.jpg' m.fl. till gemener utan prefix."""
+    if not value:
+        return None
+    value = value.strip().lower().rsplit('/', 1)[-1].lstrip('.')
+    return FILE_TYPE_ALIASES.get(value, value) or None
+
+
+def file_type_from_url(url: str) -> Optional[str]:
+    """Hämtar filändelsen från URL:ens sökväg om den ser ut som ett bildformat."""
+    path = urlparse(url).path
+    if '.' not in path.rsplit('/', 1)[-1]:
+        return None
+    extension = path.rsplit('.', 1)[-1]
+    if not extension.isalpha() or len(extension) > 5:
+        return None
+    return normalize_file_type(extension)
+
+
+def parse_bing_payload(payload: str, info_text: str = '', query: str = '') -> Optional[ImageCandidate]:
+    """
+    Skapar en kandidat från Bings m-attribut och texten i resultatets img_info-ruta.
+
+    Returns:
+        Optional[ImageCandidate]: None om payloaden saknar bild-URL
+    """
+    data = json.loads(payload)
+    url = data.get('murl', '')
+    if not url:
+        return None
+
+    width = height = None
+    size_match = SIZE_PATTERN.search(info_text or '')
+    if size_match:
+        width, height = int(size_match.group(1)), int(size_match.group(2))
+
+    type_match = TYPE_PATTERN.search(info_text or '')
+    file_type = normalize_file_type(type_match.group(1)) if type_match else file_type_from_url(url)
+
+    return ImageCandidate(
+        url=url,
+        source='Bing Images',
+        query=query,
+        thumbnail_url=data.get('turl', ''),
+        title=data.get('t', '') or '',
+        page_url=data.get('purl', ''),
+        width=width,
+        height=height,
+        file_type=file_type,
+        metadata=data,
+    )
+
+
+def rejection_reason(candidate: ImageCandidate, excluded_words: Iterable[str] = ()) -> Optional[str]:
+    """
+    Kontrollerar kandidatens annonserade metadata.
+    Okänd metadata godkänns – den verifieras senare mot själva bilden.
+
+    Returns:
+        Optional[str]: Anledning till att kandidaten sorteras bort, annars None
+    """
+    if candidate.file_type and candidate.file_type not in ALLOWED_FILE_TYPES:
+        return f"filformat {candidate.file_type}"
+
+    if candidate.width and candidate.height:
+        if candidate.width < candidate.height:
+            return f"porträttformat {candidate.width}x{candidate.height}"
+        if candidate.width < MIN_WIDTH or candidate.height < MIN_HEIGHT:
+            return f"för liten {candidate.width}x{candidate.height}"
+
+    text = f"{candidate.url} {candidate.title}".lower()
+    for word in excluded_words:
+        if word.lower() in text:
+            return f"exkluderat ord '{word}'"
+
+    return None
@@ -0,0 +1,118 @@
+"""
+Samtidig sökning i flera bildkällor.
+Varje källa körs i en egen tråd och kandidaterna levereras i den ordning de
+blir klara, så att en långsam eller blockerad källa inte avgör körtiden.
+"""
+
+import time
+import queue
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from api.candidates import ImageCandidate
+from api.provider import ImageProvider
+from utils.rate_limit import RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+# Nyckel i errors när tidsgränsen avbröt leveransen av kandidater
+TRUNCATED = '_coordinator'
+
+
+class ProviderCoordinator:
+    """Frågar alla källor parallellt och slår ihop deras kandidatströmmar."""
+
+    def __init__(self, providers: List[ImageProvider], timeout: float = 90.0):
+        self.providers = providers
+        self.timeout = timeout
+        # Fel per källa från senaste sökningen (samt TRUNCATED om leveransen avbröts)
+        self.errors: Dict[str, Exception] = {}
+
+    def candidates(self, query: str, limit: int = 12,
+                   timeout: Optional[float] = None) -> Iterator[ImageCandidate]:
+        """
+        Startar sökningen i alla källor och levererar kandidater allteftersom.
+        När anroparen slutar iterera (eller tiden tar slut) avbryts de källor
+        som fortfarande arbetar.
+        """
+        results = queue.Queue()
+        stop_event = threading.Event()
+        self.errors = {}
+
+        def run(provider: ImageProvider):
+            started = time.perf_counter()
+            count = 0
+            try:
+                for candidate in provider.search(query, limit, stop_event):
+                    results.put(candidate)
+                    count += 1
+                    if stop_event.is_set():
+                        break
+                logger.info(f"Källa {provider.name}: {count} kandidater på "
+                            f"{time.perf_counter() - started:.1f} s")
+            except RateLimitExceeded as e:
+                self.errors[provider.name] = e
+                logger.warning(f"Källa {provider.name}: {str(e)}, nästa sökning om {e.wait_seconds:.0f} s")
+            except Exception as e:
+                self.errors[provider.name] = e
+                if not stop_event.is_set():
+                    logger.error(f"Källa {provider.name} misslyckades: {str(e)}")
+            finally:
+                results.put(_DONE)
+
+        threads = {}
+        for provider in self.providers:
+            thread = threading.Thread(target=run, args=(provider,), name=f"provider-{provider.name}", daemon=True)
+            thread.start()
+            threads[provider.name] = (provider, thread)
+
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        running = len(threads)
+        timed_out = False
+        try:
+            while running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning("Tidsgräns för bildkällorna nådd")
+                    timed_out = True
+                    break
+                try:
+                    item = results.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    running -= 1
+                    continue
+                yield item
+        finally:
+            stop_event.set()
+            if timed_out:
+                # Kandidater som låg kvar i kön levererades aldrig; sökningen är då
+                # ofullständig även om alla källor hann bli klara
+                undelivered = 0
+                while True:
+                    try:
+                        item = results.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _DONE:
+                        running -= 1
+                    else:
+                        undelivered += 1
+                if running or undelivered:
+                    self.errors.setdefault(TRUNCATED, TimeoutError(
+                        f"tidsgränsen nåddes, {undelivered} kandidater levererades inte"
+                    ))
+            # Avbryt källor som fortfarande arbetar (t.ex. stäng webbläsaren)
+            for provider, thread in threads.values():
+                if thread.is_alive():
+                    if timed_out:
+                        # Källan hann inte klart och räknas som misslyckad
+                        self.errors.setdefault(provider.name, TimeoutError("tidsgränsen nåddes"))
+                    logger.info(f"Avbryter källa {provider.name}")
+                    try:
+                        provider.close()
+                    except Exception as e:
+                        logger.warning(f"Kunde inte avbryta källa {provider.name}: {str(e)}")
@@ -0,0 +1,234 @@
+"""
+Harvester - Fyller cachen i förväg med verifierade bakgrundsbilder.
+Går igenom söktermerna (alla i search_queries.ini eller ett urval) och sparar
+upp till N godkända bilder per sökterm i cache-mappen. Kandidaterna hämtas
+parallellt under en gemensam hastighetsgräns, och framstegen sparas i
+harvest_progress.json så att en avbruten körning kan fortsätta där den slutade.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from io import BytesIO
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+from api.candidates import ImageCandidate
+from api.image_search import ImageSearch
+from utils.locking import read_json, atomic_write_json
+from utils.rate_limit import TokenBucket, RateLimitExceeded
+from utils.profiling import mark_stage
+
+logger = logging.getLogger(__name__)
+
+# Längsta väntan på sökbudgeten innan en sökterm lämnas till nästa körning
+MAX_SEARCH_WAIT = 300.0
+
+
+class Harvester:
+    """Hämtar många verifierade bilder per sökterm till cachen."""
+
+    def __init__(self, per_query: int = 10, workers: int = 4, downloads_per_second: float = 2.0,
+                 image_search: Optional[ImageSearch] = None):
+        self.per_query = per_query
+        self.workers = max(1, workers)
+        self.search = image_search or ImageSearch()
+        self.paths = self.search.paths
+        self.progress_file = self.paths['harvest_progress_file']
+
+        # Gemensam hastighetsgräns för alla bildhämtningar i alla trådar; påfyllningen
+        # motsvarar den begärda takten även under en hämtning per sekund
+        capacity = max(1.0, downloads_per_second)
+        self.download_bucket = TokenBucket(capacity, capacity / downloads_per_second)
+
+        self._lock = threading.Lock()
+        self.progress = {}
+        self.stats = ImageSearch.new_stats()
+        self.stats.update({'saved': 0, 'bytes': 0})
+
+    # --- Framsteg ---
+
+    def _load_progress(self, restart: bool):
+        progress = {} if restart else read_json(self.progress_file, {})
+        if not isinstance(progress, dict):
+            progress = {}
+        progress.setdefault('queries', {})
+        self.progress = progress
+
+    def _save_progress(self):
+        """Sparar framstegen atomiskt (anropas med self._lock tagen)."""
+        try:
+            atomic_write_json(self.progress_file, self.progress)
+        except Exception as e:
+            logger.warning(f"Kunde inte spara harvest-framsteg: {str(e)}")
+
+    def _query_state(self, query: str) -> Dict:
+        return self.progress['queries'].setdefault(query, {'saved': 0, 'seen': [], 'done': False, 'target': 0})
+
+    # --- Bildhantering ---
+
+    def _save_image(self, content: bytes) -> Optional[str]:
+        """Sparar bilden i cache-mappen med ett namn baserat på innehållet."""
+        digest = hashlib.sha1(content).hexdigest()[:16]
+        img = Image.open(BytesIO(content))
+        if img.format == 'JPEG':
+            path, data = os.path.join(self.paths['cache_dir'], f"wallpaper_{digest}.jpg"), content
+        elif img.format == 'PNG':
+            path, data = os.path.join(self.paths['cache_dir'], f"wallpaper_{digest}.png"), content
+        else:
+            # Övriga format sparas som JPEG så att get_cached_image hittar dem
+            path = os.path.join(self.paths['cache_dir'], f"wallpaper_{digest}.jpg")
+            buffer = BytesIO()
+            img.convert('RGB').save(buffer, format='JPEG', quality=95)
+            data = buffer.getvalue()
+
+        if os.path.exists(path):
+            logger.info(f"Bilden finns redan i cachen: {path}")
+            return None
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def _process(self, query: str, candidate: ImageCandidate) -> bool:
+        """Verifierar och sparar en kandidat. Körs i en arbetstråd."""
+        with self._lock:
+            state = self._query_state(query)
+            if state['saved'] >= self.per_query:
+                return False
+
+        self.download_bucket.consume()
+        content = self.search.fetch_verified_image(candidate.url)
+
+        with self._lock:
+            self.stats['fetched'] += 1
+            state['seen'].append(candidate.url)
+            if content:
+                self.stats['bytes'] += len(content)
+            if not content or state['saved'] >= self.per_query:
+                self._save_progress()
+                return False
+            # Reservera platsen innan bilden sparas så att parallella trådar inte passerar N
+            state['saved'] += 1
+
+        try:
+            path = self._save_image(content)
+        except Exception as e:
+            logger.error(f"Kunde inte spara bild {candidate.url}: {str(e)}")
+            path = None
+
+        with self._lock:
+            if path:
+                self.stats['saved'] += 1
+                logger.info(f"[{query}] {state['saved']}/{self.per_query} sparad: {path}")
+            else:
+                state['saved'] -= 1
+            self._save_progress()
+        return bool(path)
+
+    # --- Huvudflöde ---
+
+    def _collect(self, query: str, seen: set, executor: ThreadPoolExecutor) -> Dict[str, Exception]:
+        """
+        Går igenom källornas kandidater en gång och hämtar de som är värda det.
+        Returnerar källornas fel (t.ex. RateLimitExceeded) från genomgången.
+        """
+        state = self.progress['queries'][query]
+        pending = set()
+        # Be om fler kandidater än som behövs eftersom många sorteras bort
+        limit = min(100, max(12, self.per_query * 3))
+        candidates = self.search.coordinator.candidates(query, limit)
+        try:
+            for candidate in candidates:
+                if state['saved'] >= self.per_query:
+                    break
+                if candidate.url in seen:
+                    continue
+                seen.add(candidate.url)
+
+                with self._lock:
+                    self.stats['candidates'] += 1
+                    worth_fetching = self.search.screen_candidate(candidate, self.stats)
+                if not worth_fetching:
+                    continue
+
+                # Håll som mest `workers` hämtningar igång så att vi inte hämtar långt fler än N
+                while len(pending) >= self.workers:
+                    _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                pending.add(executor.submit(self._process, query, candidate))
+        finally:
+            # Stänger källorna innan felen läses av
+            candidates.close()
+            wait(pending)
+        return dict(self.search.coordinator.errors)
+
+    def _harvest_query(self, query: str, executor: ThreadPoolExecutor):
+        with self._lock:
+            state = self._query_state(query)
+            seen = set(state['seen'])
+        # Klar om målet är nått, eller om källorna redan tömts för minst samma mål
+        if state['saved'] >= self.per_query or (state['done'] and state.get('target', 0) >= self.per_query):
+            logger.info(f"[{query}] redan klar ({state['saved']} bilder), hoppar över")
+            return
+
+        logger.info(f"[{query}] startar, {state['saved']}/{self.per_query} sparade sedan tidigare")
+        while True:
+            errors = self._collect(query, seen, executor)
+            self.search.host_health.save()
+            if state['saved'] >= self.per_query or not errors:
+                # Målet nått, eller alla källor har gått igenom sina resultat
+                done = True
+                break
+
+            # En slut sökbudget fylls på inom känd tid; vänta och gå igenom källorna igen
+            limited = [e for e in errors.values() if isinstance(e, RateLimitExceeded)]
+            wait_seconds = max((e.wait_seconds for e in limited), default=0.0)
+            if len(limited) == len(errors) and wait_seconds <= MAX_SEARCH_WAIT:
+                logger.info(f"[{query}] väntar {wait_seconds:.0f} s på sökbudgeten")
+                time.sleep(wait_seconds + 0.5)
+                continue
+
+            # Fel eller lång väntan: låt termen vara oklar så att nästa körning fortsätter med den
+            logger.warning(f"[{query}] ofullständig ({', '.join(f'{name}: {e}' for name, e in errors.items())}), "
+                           f"fortsätter vid nästa körning")
+            done = False
+            break
+
+        with self._lock:
+            state['done'] = done
+            state['target'] = self.per_query
+            self._save_progress()
+        logger.info(f"[{query}] {'klar' if done else 'avbruten'}: {state['saved']} bilder")
+        mark_stage(f"harvest: {query}")
+
+    def run(self, queries: Optional[List[str]] = None, restart: bool = False) -> Dict:
+        """
+        Kör harvest för angivna söktermer (standard: alla från search_queries.ini).
+
+        Returns:
+            Dict: Statistik inklusive bilder/min och MB/s
+        """
+        queries = queries or self.search.search_queries
+        self._load_progress(restart)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='harvest') as executor:
+            for query in queries:
+                try:
+                    self._harvest_query(query, executor)
+                except Exception as e:
+                    logger.error(f"[{query}] harvest misslyckades: {str(e)}")
+        elapsed = max(time.monotonic() - started, 1e-6)
+
+        self.stats['seconds'] = round(elapsed, 1)
+        self.stats['images_per_minute'] = round(self.stats['saved'] / elapsed * 60, 2)
+        self.stats['mb_per_second'] = round(self.stats['bytes'] / elapsed / 1e6, 3)
+        logger.info(
+            f"Harvest klar: {self.stats['saved']} bilder på {elapsed:.0f} s "
+            f"({self.stats['images_per_minute']} bilder/min, {self.stats['mb_per_second']} MB/s), "
+            f"hämtade {self.stats['fetched']}, förfiltrerade {self.stats['prefiltered']}"
+        )
+        return self.stats
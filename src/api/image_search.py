@@ -0,0 +1,475 @@
+"""
+ImageSearch - Söker bakgrundsbilder i alla aktiverade bildkällor.
+- Frågar källorna parallellt via ProviderCoordinator
+- Förfiltrerar på metadata och verifierar dimensioner
+- Rangordnar godkända bilder efter kvalitet
+- Hanterar historik och cachade bilder
+"""
+
+import os
+import json
+import random
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from PIL import Image
+from io import BytesIO
+
+from utils.paths import get_app_paths
+from utils.image_quality import ImageQualityScorer
+from utils.host_health import HostHealthTable
+from utils.http_cache import HttpCache, create_cached_session
+from utils.deadline import Deadline, backoff_delay
+from utils.rate_limit import RateLimitExceeded
+from api.candidates import ImageCandidate, rejection_reason
+from api.coordinator import TRUNCATED, ProviderCoordinator
+from api.provider import ImageProvider
+from api.bing_scraper import BingScraper
+from api.wikimedia import WikimediaProvider
+from api.lan_provider import LanNodeProvider
+from config.search_config import load_search_queries
+from config.app_config import load_app_config
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 16 * 1024  # Små delar så att tidsbudgeten kontrolleras ofta
+LAN_REUSE_LIMIT = 1000  # Max antal av LAN-nodens bilder som övervägs vid återanvändning
+
+
+def create_http_cache(settings, paths) -> Optional[HttpCache]:
+    """Skapar HTTP-cachen enligt [HttpCache] i settings.ini, eller None om den är avstängd."""
+    cache_settings = settings['HttpCache']
+    if not cache_settings.getboolean('enabled'):
+        return None
+    return HttpCache(
+        paths['http_cache_dir'],
+        max_bytes=int(cache_settings.getfloat('max_size_mb') * 1024 * 1024),
+        default_ttl=cache_settings.getfloat('default_ttl_hours') * 3600,
+        negative_ttl=cache_settings.getfloat('negative_ttl_hours') * 3600,
+    )
+
+
+def create_providers(settings, status_window=None, http_cache: Optional[HttpCache] = None,
+                     session: Optional[requests.Session] = None) -> List[ImageProvider]:
+    """Skapar de bildkällor som är aktiverade under [Providers] i settings.ini."""
+    providers_settings = settings['Providers']
+    factories = {
+        'bing': lambda: BingScraper(status_window),
+        'wikimedia': lambda: WikimediaProvider(
+            providers_settings.get('wikimedia_api_url') or None, session=session
+        ),
+    }
+    search_ttl = settings.getfloat('HttpCache', 'search_ttl_hours') * 3600
+
+    providers = []
+    for name in providers_settings.get('enabled', '').split(','):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in factories:
+            logger.warning(f"Okänd bildkälla i settings.ini: {name}")
+            continue
+        try:
+            provider = factories[name]()
+            provider.http_cache = http_cache
+            provider.search_ttl = search_ttl
+            providers.append(provider)
+        except Exception as e:
+            logger.error(f"Kunde inte starta bildkälla {name}: {str(e)}")
+    return providers
+
+
+class ImageSearch:
+    """Söker, verifierar och väljer en bakgrundsbild från alla aktiverade källor."""
+
+    def __init__(self, status_window=None, providers: Optional[List[ImageProvider]] = None,
+                 use_lan_node: bool = True):
+        self.status_window = status_window
+
+        # Hämta söktermer från konfiguration
+        self.search_queries, self.excluded_words = load_search_queries()
+
+        # Hämta alla sökvägar
+        self.paths = get_app_paths()
+
+        # Skapa mappar om de inte finns
+        os.makedirs(self.paths['cache_dir'], exist_ok=True)
+
+        # Ladda historik
+        self.history = self._load_history()
+
+        settings = load_app_config()
+        self.settings = settings
+        self.quality_settings = settings['Quality']
+        self.deadline_settings = settings['Deadline']
+        self.wanted_images = settings.getint('Providers', 'wanted_images')
+
+        # Gemensam HTTP-cache för sökresultat, bildverifiering och nedladdning
+        self.http_cache = create_http_cache(settings, self.paths)
+        self.session = create_cached_session(self.http_cache)
+
+        # Med en LAN-nod hämtas bilderna därifrån; de egna källorna används bara
+        # om noden inte svarar eller saknar nya bilder
+        lan_url = settings.get('LanNode', 'url').strip() if use_lan_node else ''
+        self.using_lan_node = providers is None and bool(lan_url)
+        if providers is not None:
+            self.providers = providers
+        elif self.using_lan_node:
+            self.providers = [LanNodeProvider(
+                lan_url, timeout=settings.getfloat('LanNode', 'timeout_seconds'), session=self.session
+            )]
+        else:
+            self.providers = create_providers(settings, status_window, self.http_cache, self.session)
+        self.coordinator = ProviderCoordinator(
+            self.providers, timeout=settings.getfloat('Providers', 'timeout_seconds')
+        )
+
+        # Hälsa per bildvärd (svarstid, felandel, avstängda värdar)
+        self.host_health = HostHealthTable(
+            self.paths['host_health_file'],
+            cooldown=settings.getfloat('HostHealth', 'cooldown_minutes') * 60,
+            failure_threshold=settings.getint('HostHealth', 'failure_threshold'),
+        )
+
+        # Statistik från senaste sökningen (kandidater, förfiltrerade, hämtade)
+        self.stats = {}
+
+    # --- Hjälpmetoder för konfiguration och state ---
+
+    def _load_history(self) -> list:
+        """Läser in historiken över tidigare använda bilder."""
+        if os.path.exists(self.paths['history_file']):
+            with open(self.paths['history_file'], "r", encoding="utf-8") as file:
+                try:
+                    return json.load(file)
+                except json.JSONDecodeError:
+                    return []
+        return []
+
+    def _save_history(self):
+        """Sparar historiken till fil (max 50 senaste)."""
+        with open(self.paths['history_file'], "w", encoding="utf-8") as file:
+            json.dump(self.history[-50:], file, ensure_ascii=False)
+
+    def record_used(self, image_url: str):
+        """Lägger till bilden som faktiskt laddades ner i historiken."""
+        self.history.append(image_url)
+        self._save_history()
+
+    def _create_quality_scorer(self) -> ImageQualityScorer:
+        """Skapar en kvalitetsbedömare med vikter och slumpandel från settings.ini."""
+        quality = self.quality_settings
+        return ImageQualityScorer(
+            weights={
+                'sharpness': quality.getfloat('sharpness_weight'),
+                'colorfulness': quality.getfloat('colorfulness_weight'),
+                'entropy': quality.getfloat('entropy_weight'),
+                'artifacts': quality.getfloat('artifacts_weight'),
+            },
+            randomness=quality.getfloat('randomness'),
+            cpu_budget_ms=quality.getfloat('cpu_budget_ms'),
+        )
+
+    def fetch_verified_image(self, image_url: str, deadline: Optional[Deadline] = None) -> Optional[bytes]:
+        """
+        Hämtar bilden och verifierar dimensionskraven (min 1920x1080 och landskap).
+        Returnerar bilddatan om bilden godkänns, annars None.
+        Med `deadline` avbryts hämtningen när tiden är slut.
+        """
+        try:
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0',
+                'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
+                'Accept-Language': 'en-US,en;q=0.9',
+                'Accept-Encoding': 'gzip, deflate, br',
+                'Connection': 'keep-alive',
+                'Upgrade-Insecure-Requests': '1',
+            }
+
+            timeout = self.host_health.timeout_for(image_url, 15)
+            if deadline is not None:
+                timeout = deadline.timeout(timeout)
+            try:
+                response = self.session.get(image_url, headers=headers, timeout=timeout, stream=True)
+                response.raise_for_status()
+                # Läs i delar så att en långsam värd inte kan dra över tidsbudgeten;
+                # timeouten ovan gäller bara varje enskild läsning
+                chunks = []
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    chunks.append(chunk)
+                    if deadline is not None and deadline.expired:
+                        response.close()
+                        logger.info(f"Tidsbudgeten tog slut under hämtning av {image_url}")
+                        return None
+                content = b''.join(chunks)
+            except requests.RequestException as e:
+                if not getattr(e.response, 'from_cache', False):
+                    self.host_health.record_request_error(image_url, e)
+                raise
+            # Svar direkt från cachen säger inget om värdens svarstid
+            if not getattr(response, 'from_cache', False):
+                self.host_health.record_success(image_url, response.elapsed.total_seconds())
+
+            img = Image.open(BytesIO(content))
+            width, height = img.size
+
+            if width < 1920 or height < 1080:
+                logger.info(f"Bild för liten: {width}x{height}")
+                self._remember_rejection(image_url, f"för liten {width}x{height}")
+                return None
+
+            if width < height:
+                logger.info("Bild i porträttläge")
+                self._remember_rejection(image_url, "porträttläge")
+                return None
+
+            return content
+
+        except Exception as e:
+            logger.error(f"Fel vid verifiering av bild: {str(e)}")
+            return None
+
+    def _remember_rejection(self, image_url: str, verdict: str):
+        """Sparar ett underkännande i HTTP-cachen så att bilden inte hämtas igen i onödan."""
+        if self.http_cache is not None:
+            self.http_cache.remember_verdict(image_url, verdict)
+
+    def _update_status(self, message):
+        """Uppdaterar status om status_window finns."""
+        if self.status_window:
+            self.status_window.update_status(message)
+
+    # --- Huvudflöde ---
+
+    def screen_candidate(self, candidate: ImageCandidate, stats: Dict) -> bool:
+        """
+        Avgör utan nätverksanrop om en kandidat är värd att hämta: förfiltrering
+        på metadata, tidigare underkännanden och avstängda värdar.
+        """
+        # Förfiltrera på metadata och verifiera bara de kandidater som kan godkännas
+        reason = rejection_reason(candidate, self.excluded_words)
+        if reason:
+            stats['prefiltered'] += 1
+            logger.info(f"Förfiltrerad ({reason}): {candidate.url}")
+            return False
+
+        verdict = self.http_cache.get_verdict(candidate.url) if self.http_cache else None
+        if verdict:
+            stats['cached_rejections'] += 1
+            logger.info(f"Tidigare underkänd ({verdict}): {candidate.url}")
+            return False
+
+        if self.host_health.is_open(candidate.url):
+            stats['host_skipped'] += 1
+            logger.info(f"Hoppar över avstängd värd: {candidate.url}")
+            return False
+
+        return True
+
+    def _process_candidate(self, candidate: ImageCandidate, scorer: ImageQualityScorer,
+                           valid_images: list, stats: Dict, deadline: Optional[Deadline] = None):
+        """Förfiltrerar, verifierar och kvalitetsbedömer en kandidat."""
+        try:
+            if not self.screen_candidate(candidate, stats):
+                return
+
+            stats['fetched'] += 1
+            content = self.fetch_verified_image(candidate.url, deadline)
+            if content:
+                # Skala ner direkt så att bara en liten avkodning sparas
+                scorer.add(content)
+                valid_images.append(candidate)
+                logger.info(f"Giltig bild hittad ({candidate.source}): {candidate.url}")
+
+        except Exception as e:
+            logger.error(f"Fel vid processering av bild: {str(e)}")
+
+    @staticmethod
+    def new_stats() -> Dict[str, int]:
+        """Tom statistik för en sökning."""
+        return {'candidates': 0, 'prefiltered': 0, 'cached_rejections': 0, 'host_skipped': 0, 'fetched': 0}
+
+    def _search_once(self, query: str, deadline: Deadline) -> Optional[Tuple[str, Dict]]:
+        """
+        Kör en sökning i alla källor och väljer den bästa godkända bilden.
+        Slutar ta emot kandidater så snart tillräckligt många bilder godkänts
+        eller sökningens del av tidsbudgeten är slut.
+        """
+        self._update_status("Analyserar bilder...")
+        valid_images = []
+        scorer = self._create_quality_scorer()
+        stats = self.new_stats()
+
+        # Sökning och verifiering får bara en del av den återstående tiden;
+        # resten sparas till nedladdningen och eventuella omförsök
+        search_deadline = deadline.stage(self.deadline_settings.getfloat('search_share'))
+        timeout = min(self.coordinator.timeout, search_deadline.remaining())
+
+        # Värdar som ofta misslyckas prövas först när kandidatströmmen är slut
+        deferred = []
+        for candidate in self.coordinator.candidates(query, timeout=timeout):
+            if candidate.url in self.history:
+                continue
+            stats['candidates'] += 1
+            if self.host_health.is_unhealthy(candidate.url):
+                deferred.append(candidate)
+                continue
+            self._process_candidate(candidate, scorer, valid_images, stats, search_deadline)
+            if len(valid_images) >= self.wanted_images or search_deadline.expired:
+                break
+
+        for candidate in deferred:
+            if len(valid_images) >= self.wanted_images or search_deadline.expired:
+                break
+            self._process_candidate(candidate, scorer, valid_images, stats, search_deadline)
+
+        if search_deadline.expired:
+            logger.warning(f"Tidsbudgeten för sökningen ({search_deadline.seconds:.0f} s) tog slut")
+
+        self.host_health.save()
+        logger.info(
+            f"Kandidater: {stats['candidates']}, förfiltrerade: {stats['prefiltered']} "
+            f"(undvikna hämtningar), tidigare underkända: {stats['cached_rejections']}, "
+            f"avstängda värdar: {stats['host_skipped']}, "
+            f"hämtade: {stats['fetched']}, godkända: {len(valid_images)}"
+        )
+        self.stats = stats
+
+        if not valid_images:
+            logger.warning("Inga giltiga bilder hittades")
+            return None
+
+        # Välj bild efter kvalitet med viss slump
+        self._update_status("Väljer bild...")
+        ranking = scorer.ranking()
+        selected = valid_images[ranking[0]]
+
+        # Övriga godkända bilder i rangordning, som reserv om nedladdningen går trögt.
+        # Historiken uppdateras först när det är känt vilken bild som laddades ner
+        alternates = [valid_images[i].url for i in ranking[1:]]
+        return selected.url, {
+            "source": selected.source,
+            "query": selected.query,
+            "alternates": alternates,
+            "sources": {image.url: image.source for image in valid_images},
+        }
+
+    def create_deadline(self) -> Deadline:
+        """Skapar körningens samlade tidsbudget från [Deadline] i settings.ini."""
+        return Deadline(self.deadline_settings.getfloat('total_seconds'))
+
+    def _reuse_lan_image(self, query: str) -> Optional[Tuple[str, Dict]]:
+        """
+        Väljer en av LAN-nodens bilder som redan använts: i första hand en som
+        finns i HTTP-cachen (ingen överföring), därefter den som använts längst sedan.
+        """
+        try:
+            # Nodens lista förnyas med If-None-Match och är oftast ett 304-svar
+            candidates = list(self.providers[0].search(query, limit=LAN_REUSE_LIMIT))
+        except Exception as e:
+            logger.warning(f"Kunde inte läsa LAN-nodens lista: {str(e)}")
+            return None
+        if not candidates:
+            return None
+
+        def last_used(url: str) -> int:
+            # Index i historiken; -1 för bilder som aldrig använts här
+            return max((i for i, used in enumerate(self.history) if used == url), default=-1)
+
+        cached = self.http_cache.contains if self.http_cache is not None else (lambda url: False)
+        ranked = sorted(candidates, key=lambda c: (not cached(c.url), last_used(c.url)))
+        selected = ranked[0]
+        logger.info(f"Inga nya bilder på LAN-noden, återanvänder {selected.url}")
+        return selected.url, {
+            "source": selected.source,
+            "query": selected.query,
+            "alternates": [c.url for c in ranked[1:]],
+            "sources": {c.url: c.source for c in ranked},
+        }
+
+    def _use_local_providers(self):
+        """Byter från LAN-noden till de egna bildkällorna i settings.ini."""
+        self.using_lan_node = False
+        self.providers = create_providers(self.settings, self.status_window, self.http_cache, self.session)
+        self.coordinator = ProviderCoordinator(self.providers, timeout=self.coordinator.timeout)
+
+    def get_random_image(self, deadline: Optional[Deadline] = None) -> Optional[Tuple[str, Dict]]:
+        """
+        Hämtar en slumpmässig bild från de aktiverade bildkällorna.
+        Försöker igen med en ny sökterm om ingen bild godkändes och någon källa
+        misslyckades med fel, med exponentiell backoff och så länge tidsbudgeten räcker.
+
+        Returns:
+            Tuple[str, Dict]: Bildens URL och metadata; meta['alternates'] innehåller
+            övriga godkända bilder i rangordning
+        """
+        deadline = deadline or self.create_deadline()
+
+        if self.using_lan_node:
+            query = random.choice(self.search_queries)
+            result = self._search_once(query, deadline)
+            if result:
+                return result
+            # Att noden saknar nya bilder är normalt när klienten körs oftare än noden
+            # fyller på; sök bara själv om noden inte gick att nå
+            error = self.coordinator.errors.get('lan')
+            result = None if error else self._reuse_lan_image(query)
+            if result:
+                return result
+            logger.warning(f"LAN-noden gav ingen bild ({error or 'biblioteket är tomt'}), söker själv")
+            self._update_status("Söker själv...")
+            self._use_local_providers()
+
+        if not self.providers:
+            logger.error("Inga bildkällor är aktiverade")
+            return None
+        backoff_base = self.deadline_settings.getfloat('backoff_base_seconds')
+        backoff_max = self.deadline_settings.getfloat('backoff_max_seconds')
+
+        max_retries = 3
+        for attempt in range(max_retries):
+            query = random.choice(self.search_queries)
+            logger.info(f"Försök {attempt + 1}/{max_retries} - Söker efter: {query} ({deadline})")
+
+            result = self._search_once(query, deadline)
+            if result:
+                return result
+
+            # Ingen bild godkändes. Försök igen om någon källa misslyckades med ett fel
+            # (t.ex. en tillfälligt trasig webbläsare) även om andra källor svarade;
+            # en slut sökbudget blir däremot inte bättre av ett nytt försök
+            failures = {name: e for name, e in self.coordinator.errors.items()
+                        if name != TRUNCATED and not isinstance(e, RateLimitExceeded)}
+            if not failures:
+                return None
+            logger.warning(f"Misslyckade källor: {', '.join(f'{name} ({e})' for name, e in failures.items())}")
+
+            if attempt == max_retries - 1:
+                logger.error(f"Alla {max_retries} försök misslyckades")
+                break
+
+            # Vänta bara om det finns tid kvar för ett nytt försök efteråt
+            delay = backoff_delay(attempt, backoff_base, backoff_max)
+            if delay >= deadline.remaining():
+                logger.error("Tidsbudgeten räcker inte till fler försök")
+                break
+            self._update_status("Försöker igen...")
+            logger.info(f"Väntar {delay:.1f} s före nästa försök")
+            time.sleep(delay)
+
+        return None
+
+    def get_cached_image(self) -> Optional[str]:
+        """Returnerar en slumpmässig bild från cachen om tillgänglig."""
+        try:
+            cached_files = [
+                f for f in os.listdir(self.paths['cache_dir'])
+                if f.lower().endswith(('.jpg', '.jpeg', '.png'))
+            ]
+            if cached_files:
+                return os.path.join(self.paths['cache_dir'], random.choice(cached_files))
+        except Exception as e:
+            logger.error(f"Fel vid hämtning från cache: {str(e)}")
+        return None
@@ -0,0 +1,267 @@
+"""
+LAN-nod - Delar verifierade bakgrundsbilder med andra datorer i nätverket.
+En dator kör `SearchWallpaper serve` och söker, verifierar och laddar ner
+bilder som vanligt. Övriga datorer pekar ut noden med url under [LanNode]
+i settings.ini och hämtar bilderna därifrån (api.lan_provider) i stället
+för att starta en egen webbläsare.
+
+API:
+- GET /wallpapers       Lista över bilderna med metadata (JSON, ETag, no-cache)
+- GET /wallpapers/<id>  Själva bilden; id är innehållets SHA-1, så svaret ändras aldrig
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+from api.image_search import ImageSearch
+from utils.locking import SingleInstance, read_json, atomic_write_json
+from utils.paths import get_app_paths
+from utils.wallpaper import download_image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+CONTENT_TYPES = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png'}
+CHUNK_SIZE = 64 * 1024
+
+
+class WallpaperLibrary:
+    """Bilderna i cache-mappen, med innehållshash och metadata från lan_library.json."""
+
+    def __init__(self, cache_dir: str, index_file: str):
+        self.cache_dir = cache_dir
+        self.index_file = index_file
+        self._mutex = threading.Lock()
+        # Filnamn -> (storlek, mtime, post) så att varje fil bara hashas en gång
+        self._scanned: Dict[str, Tuple[int, float, Dict]] = {}
+        self._by_id: Dict[str, str] = {}
+
+    def _describe(self, path: str, metadata: Dict) -> Dict:
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                sha1.update(chunk)
+        with Image.open(path) as img:
+            width, height = img.size
+            file_type = (img.format or '').lower()
+        image_id = sha1.hexdigest()
+        return {
+            'id': image_id,
+            'path': f"/wallpapers/{image_id}",
+            'width': width,
+            'height': height,
+            'file_type': file_type,
+            'size': os.path.getsize(path),
+            'source': metadata.get('source', ''),
+            'query': metadata.get('query', ''),
+            'url': metadata.get('url', ''),
+            'added': metadata.get('added') or os.path.getmtime(path),
+        }
+
+    def scan(self) -> Tuple[bytes, str]:
+        """Läser av cache-mappen och returnerar listan som JSON samt dess ETag."""
+        metadata = read_json(self.index_file, {}) or {}
+        with self._mutex:
+            scanned = {}
+            for entry in os.scandir(self.cache_dir):
+                if not entry.is_file() or not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                stat = entry.stat()
+                previous = self._scanned.get(entry.name)
+                if previous and previous[:2] == (stat.st_size, stat.st_mtime):
+                    scanned[entry.name] = previous
+                    continue
+                try:
+                    item = self._describe(entry.path, metadata.get(entry.name, {}))
+                except Exception as e:
+                    logger.warning(f"Hoppar över oläsbar bild {entry.name}: {str(e)}")
+                    continue
+                scanned[entry.name] = (stat.st_size, stat.st_mtime, item)
+            self._scanned = scanned
+            self._by_id = {item['id']: name for name, (_, _, item) in scanned.items()}
+
+            items = sorted((item for _, _, item in scanned.values()), key=lambda i: i['added'], reverse=True)
+        body = json.dumps({'wallpapers': items}, ensure_ascii=False).encode('utf-8')
+        return body, f'"{hashlib.sha1(body).hexdigest()}"'
+
+    def path_for(self, image_id: str) -> Optional[str]:
+        with self._mutex:
+            name = self._by_id.get(image_id)
+        if name is None:
+            return None
+        path = os.path.join(self.cache_dir, name)
+        return path if os.path.exists(path) else None
+
+    def add(self, path: str, meta: Dict):
+        """Registrerar metadata för en bild som noden själv laddat ner."""
+        metadata = read_json(self.index_file, {}) or {}
+        metadata[os.path.basename(path)] = {
+            'source': meta.get('source', ''),
+            'query': meta.get('query', ''),
+            'url': meta.get('url', ''),
+            'added': time.time(),
+        }
+        atomic_write_json(self.index_file, metadata)
+
+    def prune(self, max_images: int):
+        """Tar bort de äldsta bilderna som noden laddat ner när de blir fler än max_images."""
+        metadata = read_json(self.index_file, {}) or {}
+        if len(metadata) <= max_images:
+            return
+        oldest = sorted(metadata, key=lambda name: metadata[name].get('added', 0))
+        for name in oldest[:len(metadata) - max_images]:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            del metadata[name]
+        atomic_write_json(self.index_file, metadata)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "SearchWallpaperNode/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _not_modified(self, etag: str) -> bool:
+        tags = [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]
+        return etag in tags or '*' in tags
+
+    def _send_headers(self, status: int, etag: str, cache_control: str,
+                      content_type: str = '', length: int = 0):
+        self.send_response(status)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        if status != 304:
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(length))
+        self.end_headers()
+
+    def do_GET(self):
+        library = self.server.library
+        path = self.path.split('?', 1)[0].rstrip('/')
+        try:
+            if path == '/wallpapers':
+                body, etag = library.scan()
+                # Listan ändras när noden hämtar nya bilder och ska alltid förnyas
+                if self._not_modified(etag):
+                    self._send_headers(304, etag, 'no-cache')
+                    return
+                self._send_headers(200, etag, 'no-cache', 'application/json', len(body))
+                self.wfile.write(body)
+                return
+
+            if path.startswith('/wallpapers/'):
+                image_id = path.rsplit('/', 1)[-1]
+                image_path = library.path_for(image_id)
+                if image_path is None:
+                    self.send_error(404, "Bilden finns inte")
+                    return
+                etag = f'"{image_id}"'
+                # Innehållsadresserad bild: samma id ger alltid samma bytes
+                cache_control = 'max-age=31536000, immutable'
+                if self._not_modified(etag):
+                    self._send_headers(304, etag, cache_control)
+                    return
+                extension = os.path.splitext(image_path)[1].lower()
+                self._send_headers(200, etag, cache_control, CONTENT_TYPES.get(extension, 'application/octet-stream'),
+                                   os.path.getsize(image_path))
+                with open(image_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                        self.wfile.write(chunk)
+                return
+
+            self.send_error(404)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            logger.error(f"Fel vid svar på {self.path}: {str(e)}")
+            try:
+                self.send_error(500)
+            except Exception:
+                pass
+
+
+class LanNode:
+    """HTTP-server som delar bilderna i cache-mappen och fyller på med nya."""
+
+    def __init__(self, host: str = '0.0.0.0', port: int = 8765,
+                 refresh_minutes: float = 60.0, max_images: int = 200):
+        self.paths = get_app_paths()
+        self.refresh_interval = refresh_minutes * 60
+        self.max_images = max_images
+        self.library = WallpaperLibrary(self.paths['cache_dir'], self.paths['lan_library_file'])
+
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.library = self.library
+        self._stop_event = threading.Event()
+        self._refresher = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.server.server_address[:2]
+
+    def fetch_new_wallpaper(self) -> Optional[str]:
+        """Kör sök- och nedladdningsflödet en gång och lägger till bilden i biblioteket."""
+        instance = SingleInstance(self.paths['instance_lock_file'])
+        if not instance.try_acquire():
+            logger.info("En annan körning pågår, hoppar över påfyllning")
+            return None
+        try:
+            # Noden söker alltid själv, även om en LAN-nod är angiven i settings.ini
+            search = ImageSearch(use_lan_node=False)
+            deadline = search.create_deadline()
+            result = search.get_random_image(deadline)
+            if not result:
+                return None
+            image_url, meta = result
+            save_path = os.path.join(self.paths['cache_dir'], f"lan_wallpaper_{os.urandom(4).hex()}.jpg")
+            settings = search.deadline_settings
+            downloaded_url = download_image(
+                image_url, save_path, search.host_health, search.session,
+                alternates=meta.get('alternates', []), deadline=deadline,
+                hedge_after=settings.getfloat('hedge_after_seconds'),
+                hedge_min_rate=settings.getfloat('hedge_min_kbps') * 1024,
+            )
+            if not downloaded_url:
+                return None
+            search.record_used(downloaded_url)
+            source = meta.get('sources', {}).get(downloaded_url, meta.get('source', ''))
+            self.library.add(save_path, dict(meta, url=downloaded_url, source=source))
+            self.library.prune(self.max_images)
+            logger.info(f"Ny bild i LAN-biblioteket: {save_path}")
+            return save_path
+        except Exception as e:
+            logger.error(f"Påfyllning av LAN-biblioteket misslyckades: {str(e)}")
+            return None
+        finally:
+            instance.release()
+
+    def _refresh_loop(self):
+        while not self._stop_event.is_set():
+            self.fetch_new_wallpaper()
+            self._stop_event.wait(self.refresh_interval)
+
+    def serve_forever(self):
+        """Startar påfyllningen (om refresh_minutes > 0) och svarar på förfrågningar tills shutdown()."""
+        if self.refresh_interval > 0:
+            self._refresher = threading.Thread(target=self._refresh_loop, name='lan-refresh', daemon=True)
+            self._refresher.start()
+        host, port = self.address
+        logger.info(f"LAN-nod lyssnar på http://{host}:{port}/wallpapers")
+        self.server.serve_forever()
+
+    def shutdown(self):
+        self._stop_event.set()
+        self.server.shutdown()
+        self.server.server_close()
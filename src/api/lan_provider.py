@@ -0,0 +1,59 @@
+"""
+LanNodeProvider - Hämtar bakgrundsbilder från en LAN-nod i stället för att söka själv.
+Noden (api.lan_node) kör hela sök- och nedladdningsflödet och delar de
+verifierade bilderna. Listan och bilderna hämtas via den vanliga sessionen,
+så HTTP-cachen sparar dem lokalt och förnyar listan med If-None-Match.
+"""
+
+import random
+import logging
+import threading
+from typing import Iterator, Optional
+from urllib.parse import urljoin
+
+import requests
+
+from api.candidates import ImageCandidate, normalize_file_type
+from api.provider import ImageProvider
+
+logger = logging.getLogger(__name__)
+
+
+class LanNodeProvider(ImageProvider):
+    """Bildkälla som listar bilderna på en LAN-nod."""
+
+    name = 'lan'
+
+    def __init__(self, base_url: str, timeout: float = 5.0,
+                 session: Optional[requests.Session] = None):
+        self.base_url = base_url.rstrip('/') + '/'
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def search(self, query: str, limit: int = 12,
+               stop_event: Optional[threading.Event] = None) -> Iterator[ImageCandidate]:
+        """Levererar nodens bilder i slumpad ordning; söktermen används inte."""
+        response = self.session.get(urljoin(self.base_url, 'wallpapers'), timeout=self.timeout)
+        response.raise_for_status()
+        wallpapers = response.json().get('wallpapers', [])
+        logger.info(f"LAN-nod {self.base_url}: {len(wallpapers)} bilder")
+
+        random.shuffle(wallpapers)
+        for item in wallpapers[:limit]:
+            if stop_event is not None and stop_event.is_set():
+                return
+            yield ImageCandidate(
+                url=urljoin(self.base_url, item['path'].lstrip('/')),
+                source=f"LAN-nod ({item.get('source') or 'okänd källa'})",
+                query=item.get('query') or query,
+                title=item.get('title', ''),
+                page_url=item.get('url', ''),
+                width=item.get('width'),
+                height=item.get('height'),
+                file_type=normalize_file_type(item.get('file_type')),
+                metadata=item,
+            )
+
+    def close(self):
+        # Sessionen delas med verifieringen (HTTP-cachen) och stängs därför inte här
+        pass
@@ -0,0 +1,70 @@
+"""
+Gemensamt gränssnitt för bildkällor.
+En källa tar emot en sökterm och levererar en ström av ImageCandidate med
+den metadata källan har. Filtrering, verifiering och val av bild sker i
+api.image_search oavsett källa.
+"""
+
+import json
+import time
+import logging
+import threading
+from typing import Any, Iterator, Optional
+
+from api.candidates import ImageCandidate
+
+logger = logging.getLogger(__name__)
+
+
+class SearchCancelled(Exception):
+    """Sökningen avbröts av koordinatorn innan källan hann leverera något."""
+
+
+class ImageProvider:
+    """Basklass för bildkällor."""
+
+    # Kort namn som används i settings.ini och loggar
+    name = ''
+
+    # Sätts av create_providers: cache för sökresultat och hur länge de är färska
+    http_cache = None
+    search_ttl = 0.0
+
+    def _load_cached_results(self, key: str) -> Optional[Any]:
+        """Returnerar färska sökresultat för nyckeln (oftast sökningens URL) från cachen."""
+        if self.http_cache is None:
+            return None
+        entry = self.http_cache.lookup(key)
+        if not entry or entry['expires_at'] <= time.time():
+            return None
+        try:
+            results = json.loads(entry['body'])
+        except ValueError:
+            return None
+        logger.info(f"Använder cachade sökresultat från {self.name}")
+        return results
+
+    def _store_results(self, key: str, results: Any):
+        """Sparar sökresultat i cachen så att samma sökning inte behöver göras om."""
+        if self.http_cache is None or self.search_ttl <= 0:
+            return
+        body = json.dumps(results, ensure_ascii=False).encode('utf-8')
+        self.http_cache.store(key, 200, {'Content-Type': 'application/json'}, body, self.search_ttl)
+
+    def search(self, query: str, limit: int = 12,
+               stop_event: Optional[threading.Event] = None) -> Iterator[ImageCandidate]:
+        """
+        Söker efter bilder och levererar kandidater allteftersom de blir kända.
+
+        Args:
+            query (str): Sökterm
+            limit (int): Max antal kandidater
+            stop_event (threading.Event): Sätts när koordinatorn inte behöver fler kandidater
+
+        Yields:
+            ImageCandidate: Kandidater i källans egen ordning
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Frigör resurser som källan håller (t.ex. webbläsare eller sessioner)."""
@@ -0,0 +1,92 @@
+"""
+WikimediaProvider - Hämtar bilder från Wikimedia Commons via MediaWiki-API:t.
+API:t returnerar JSON med storlek och MIME-typ för varje fil, så kandidaterna
+kan förfiltreras helt utan att bilderna behöver hämtas.
+"""
+
+import logging
+import threading
+from typing import Iterator, Optional
+
+import requests
+
+from api.candidates import ImageCandidate, normalize_file_type
+from api.provider import ImageProvider
+
+logger = logging.getLogger(__name__)
+
+# Ord i söktermerna som är till för Bing och bara ger sämre träffar på Commons
+IGNORED_QUERY_WORDS = {'wallpaper', 'wallpapers', 'pet', 'beautiful'}
+
+
+class WikimediaProvider(ImageProvider):
+    """Bildkälla som söker bland filer på Wikimedia Commons."""
+
+    name = 'wikimedia'
+    API_URL = "https://commons.wikimedia.org/w/api.php"
+    USER_AGENT = "SearchWallpaper/1.0 (https://github.com/cgillinger/search_wallpaper)"
+
+    def __init__(self, api_url: Optional[str] = None, timeout: float = 10.0,
+                 session: Optional[requests.Session] = None):
+        self.api_url = api_url or self.API_URL
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    @staticmethod
+    def _simplify_query(query: str) -> str:
+        words = [w for w in query.split() if w.lower() not in IGNORED_QUERY_WORDS]
+        return ' '.join(words) or query
+
+    def search(self, query: str, limit: int = 12,
+               stop_event: Optional[threading.Event] = None) -> Iterator[ImageCandidate]:
+        """Söker bland bitmappsfiler på Commons och levererar kandidater med storlek och format."""
+        search_query = self._simplify_query(query)
+        params = {
+            'action': 'query',
+            'format': 'json',
+            'generator': 'search',
+            'gsrsearch': f"{search_query} filetype:bitmap",
+            'gsrnamespace': 6,  # File:
+            'gsrlimit': limit,
+            'prop': 'imageinfo',
+            'iiprop': 'url|size|mime',
+            'iiurlwidth': 320,
+        }
+        # API-svaren saknar valideringshuvuden, så hela svaret cachas som sökresultat
+        cache_key = requests.Request('GET', self.api_url, params=params).prepare().url
+        data = self._load_cached_results(cache_key)
+        if data is None:
+            logger.info(f"Söker på Wikimedia Commons efter: {search_query}")
+            response = self.session.get(
+                self.api_url, params=params, timeout=self.timeout,
+                headers={'User-Agent': self.USER_AGENT},
+            )
+            response.raise_for_status()
+            data = response.json()
+            self._store_results(cache_key, data)
+
+        pages = data.get('query', {}).get('pages', {})
+        # Sökordningen finns i 'index' eftersom pages är en dict
+        for page in sorted(pages.values(), key=lambda p: p.get('index', 0)):
+            if stop_event is not None and stop_event.is_set():
+                return
+            info = (page.get('imageinfo') or [{}])[0]
+            url = info.get('url')
+            if not url:
+                continue
+            yield ImageCandidate(
+                url=url,
+                source='Wikimedia Commons',
+                query=query,
+                thumbnail_url=info.get('thumburl', ''),
+                title=page.get('title', ''),
+                page_url=info.get('descriptionurl', ''),
+                width=info.get('width'),
+                height=info.get('height'),
+                file_type=normalize_file_type(info.get('mime')),
+                metadata=info,
+            )
+
+    def close(self):
+        # Sessionen kan delas med verifieringen (HTTP-cachen) och stängs därför inte här
+        pass
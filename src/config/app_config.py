@@ -0,0 +1,97 @@
+"""
+Hantering av programinställningar från extern konfigurationsfil (settings.ini).
+"""
+import os
+import configparser
+import logging
+from utils.paths import get_app_paths
+
+logger = logging.getLogger(__name__)
+
+# Standardvärden för alla inställningar. Saknade sektioner/nycklar i
+# settings.ini fylls i härifrån så att äldre filer fortsätter fungera.
+DEFAULT_SETTINGS = {
+    'Limits': {
+        'searches_per_day': '50',
+        'searches_per_minute': '3',
+        'instance_wait_seconds': '300',
+    },
+    'Quality': {
+        'sharpness_weight': '0.35',
+        'colorfulness_weight': '0.15',
+        'entropy_weight': '0.2',
+        'artifacts_weight': '0.3',
+        'randomness': '0.3',
+        'cpu_budget_ms': '60',
+    },
+    'Providers': {
+        'enabled': 'bing, wikimedia',
+        'wanted_images': '4',
+        'timeout_seconds': '90',
+        'wikimedia_api_url': 'https://commons.wikimedia.org/w/api.php',
+    },
+    'HostHealth': {
+        'cooldown_minutes': '30',
+        'failure_threshold': '3',
+    },
+    'HttpCache': {
+        'enabled': 'yes',
+        'max_size_mb': '200',
+        'default_ttl_hours': '24',
+        'negative_ttl_hours': '24',
+        'search_ttl_hours': '6',
+    },
+    'Deadline': {
+        'total_seconds': '180',
+        'search_share': '0.6',
+        'backoff_base_seconds': '2',
+        'backoff_max_seconds': '20',
+        'hedge_after_seconds': '3',
+        'hedge_min_kbps': '300',
+    },
+    'LanNode': {
+        'url': '',
+        'timeout_seconds': '5',
+        'host': '0.0.0.0',
+        'port': '8765',
+        'refresh_minutes': '60',
+        'max_images': '200',
+    },
+    'Profiling': {
+        'enabled': 'no',
+        'trace_memory': 'no',
+        'keep_runs': '5',
+        'sample_interval_ms': '10',
+    },
+    'Harvest': {
+        'per_query': '10',
+        'workers': '4',
+        'downloads_per_second': '2',
+    },
+}
+
+def load_app_config() -> configparser.ConfigParser:
+    """
+    Läser in programinställningar från settings.ini.
+    Om filen inte finns, skapas den med standardvärden.
+    """
+    paths = get_app_paths()
+    config_file = paths['settings_file']
+
+    config = configparser.ConfigParser()
+    config.read_dict(DEFAULT_SETTINGS)
+
+    if not os.path.exists(config_file):
+        try:
+            with open(config_file, 'w', encoding='utf-8') as f:
+                config.write(f)
+            logger.info(f"Skapade ny inställningsfil: {config_file}")
+        except Exception as e:
+            logger.error(f"Kunde inte skapa inställningsfil: {str(e)}")
+        return config
+
+    try:
+        config.read(config_file, encoding='utf-8')
+    except Exception as e:
+        logger.error(f"Fel vid läsning av inställningsfil: {str(e)}")
+    return config
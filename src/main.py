@@ -5,14 +5,20 @@ Huvudprogram för Bing Wallpaper
 import os
 import sys
 import logging
+import argparse
 import tempfile
 import tkinter as tk
 from tkinter import ttk
 import time
-from api.bing_scraper import BingScraper
+from api.image_search import ImageSearch
+from api.harvest import Harvester
+from api.lan_node import LanNode
 from utils.wallpaper import set_wallpaper, download_image
 from config.logging_config import setup_logging
 from utils.paths import get_app_paths, needs_admin
+from utils.locking import SingleInstance, read_json, atomic_write_json
+from utils.profiling import create_profiler, mark_stage
+from config.app_config import load_app_config
 
 # Konfigurera loggning
 setup_logging()
@@ -68,10 +74,140 @@ class StatusWindow:
         except Exception as e:
             logger.error(f"Fel vid stängning av GUI: {str(e)}")
 
+def _wait_for_running_instance(instance, paths, status) -> bool:
+    """
+    Väntar på en annan körning som redan hämtar en bild.
+
+    Returns:
+        bool: True om den här körningen ska avslutas (den andra körningen satte
+              en ny bild eller blev inte klar i tid), False om vi själva har
+              tagit över instanslåset och ska hämta en bild
+    """
+    wait_seconds = load_app_config().getint('Limits', 'instance_wait_seconds')
+    wait_started = time.time()
+    logger.info("En annan körning pågår redan, väntar på att den blir klar")
+    status.update_status("Väntar på pågående hämtning...")
+
+    if not instance.wait(timeout=wait_seconds):
+        logger.warning(f"Den andra körningen blev inte klar inom {wait_seconds} s")
+        status.update_status("En annan körning pågår fortfarande")
+        return True
+
+    last_run = read_json(paths['last_run_file'], {}) or {}
+    if last_run.get('finished', 0) >= wait_started:
+        logger.info(f"Den andra körningen satte bakgrundsbild: {last_run.get('image')}")
+        status.update_status("Bakgrundsbild hämtad av annan körning")
+        return True
+
+    logger.info("Den andra körningen misslyckades, hämtar bild själv")
+    return False
+
+def _record_run(paths, image_path):
+    """Sparar resultatet av körningen så att väntande instanser kan återanvända det."""
+    try:
+        atomic_write_json(paths['last_run_file'], {"finished": time.time(), "image": image_path})
+    except Exception as e:
+        logger.warning(f"Kunde inte spara körningsresultat: {str(e)}")
+
+def parse_args(argv=None):
+    """Tolkar kommandoradsargument. Utan kommando hämtas och sätts en bakgrundsbild."""
+    parser = argparse.ArgumentParser(prog="SearchWallpaper")
+    parser.add_argument('--profile', action='store_true',
+                        help="Spara en cProfile-dump och stackprofil för körningen i logs-mappen")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="Spara även största minnesallokeringarna per steg (tracemalloc)")
+    commands = parser.add_subparsers(dest='command')
+
+    harvest = commands.add_parser('harvest', help="Fyll cachen i förväg med verifierade bilder")
+    harvest.add_argument('--queries', nargs='+', metavar='SÖKTERM',
+                         help="Söktermer att hämta (standard: alla i search_queries.ini)")
+    harvest.add_argument('--per-query', type=int, help="Max antal bilder per sökterm")
+    harvest.add_argument('--workers', type=int, help="Antal parallella hämtningar")
+    harvest.add_argument('--rate', type=float, help="Max bildhämtningar per sekund (totalt)")
+    harvest.add_argument('--restart', action='store_true',
+                         help="Börja om i stället för att fortsätta föregående harvest")
+
+    serve = commands.add_parser('serve', help="Kör som LAN-nod som delar bilder med andra datorer")
+    serve.add_argument('--host', help="Adress att lyssna på (standard: host under [LanNode])")
+    serve.add_argument('--port', type=int, help="Port att lyssna på (standard: port under [LanNode])")
+    serve.add_argument('--no-refresh', action='store_true',
+                       help="Dela bara befintliga bilder i cachen, hämta inga nya")
+
+    return parser.parse_args(argv)
+
+def run_harvest(args) -> int:
+    """Kör harvest-kommandot och returnerar en exit-kod."""
+    paths = get_app_paths()
+    # Eget lås: en harvest kan pågå i timmar och ska inte hindra vanliga körningar
+    # från att byta bakgrundsbild; sökbudgeten delas ändå via daily_search_count.json
+    instance = SingleInstance(paths['harvest_lock_file'])
+    if not instance.try_acquire():
+        logger.error("En annan harvest pågår redan, avbryter")
+        return 1
+
+    try:
+        settings = load_app_config()['Harvest']
+        harvester = Harvester(
+            per_query=args.per_query or settings.getint('per_query'),
+            workers=args.workers or settings.getint('workers'),
+            downloads_per_second=args.rate or settings.getfloat('downloads_per_second'),
+        )
+        stats = harvester.run(args.queries, restart=args.restart)
+        return 0 if stats['saved'] or not stats['fetched'] else 1
+    except KeyboardInterrupt:
+        logger.info("Harvest avbruten, fortsätter där den slutade vid nästa körning")
+        return 130
+    finally:
+        instance.release()
+
+def run_serve(args) -> int:
+    """Kör programmet som LAN-nod tills det avbryts."""
+    settings = load_app_config()['LanNode']
+    try:
+        node = LanNode(
+            host=args.host or settings.get('host'),
+            port=args.port or settings.getint('port'),
+            refresh_minutes=0 if args.no_refresh else settings.getfloat('refresh_minutes'),
+            max_images=settings.getint('max_images'),
+        )
+    except OSError as e:
+        logger.error(f"Kunde inte starta LAN-nod: {str(e)}")
+        return 1
+
+    try:
+        node.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("LAN-nod avslutas")
+    finally:
+        node.shutdown()
+    return 0
+
 def main():
     """
     Huvudfunktion som kör programmet.
     """
+    args = parse_args()
+    profiler = create_profiler(
+        load_app_config(), get_app_paths()['logs_dir'],
+        profile=args.profile, trace_memory=args.profile_memory,
+    )
+    if profiler:
+        profiler.start()
+    try:
+        if args.command == 'harvest':
+            sys.exit(run_harvest(args))
+        if args.command == 'serve':
+            sys.exit(run_serve(args))
+        run_wallpaper()
+    finally:
+        if profiler:
+            profiler.stop()
+
+def run_wallpaper():
+    """
+    Söker, laddar ner och ställer in en ny bakgrundsbild.
+    """
+    instance = None
     try:
         logger.info("Startar Bing Wallpaper-applikationen")
         
@@ -87,11 +223,23 @@ def main():
 
         # Hämta sökvägar
         paths = get_app_paths()
+
+        # Bara en körning åt gången får starta webbläsaren; en andra start
+        # väntar in den pågående hämtningen i stället för att söka själv
+        instance = SingleInstance(paths['instance_lock_file'])
+        if not instance.try_acquire():
+            if _wait_for_running_instance(instance, paths, status):
+                time.sleep(2)
+                status.close()
+                return
         
-        # Initiera BingScraper och sök efter bild
+        # Sök efter bild i alla aktiverade bildkällor
         status.update_status("Söker efter bilder...")
-        scraper = BingScraper()
-        image_result = scraper.get_random_image()
+        scraper = ImageSearch()
+        # En samlad tidsbudget för sökning, omförsök och nedladdning
+        deadline = scraper.create_deadline()
+        image_result = scraper.get_random_image(deadline)
+        mark_stage('sökning')
         
         if not image_result:
             status.update_status("Använder cachad bild...")
@@ -99,6 +247,7 @@ def main():
             cached_image = scraper.get_cached_image()
             if cached_image:
                 if set_wallpaper(cached_image):
+                    _record_run(paths, cached_image)
                     status.update_status("Bakgrundsbild uppdaterad!")
                     time.sleep(2)
                 else:
@@ -113,21 +262,33 @@ def main():
             return
 
         # Hantera ny bild
-        image_url = image_result[0]
+        image_url, image_meta = image_result
         logger.info(f"Hämtar bild: {image_url}")
         status.update_status("Laddar ner bild...")
 
         cache_filename = f"bing_wallpaper_{os.urandom(4).hex()}.jpg"
         cache_path = os.path.join(paths['cache_dir'], cache_filename)
         
-        if not download_image(image_url, cache_path):
+        deadline_settings = scraper.deadline_settings
+        downloaded_url = download_image(
+            image_url, cache_path, scraper.host_health, scraper.session,
+            alternates=image_meta.get('alternates', []),
+            deadline=deadline,
+            hedge_after=deadline_settings.getfloat('hedge_after_seconds'),
+            hedge_min_rate=deadline_settings.getfloat('hedge_min_kbps') * 1024,
+        )
+        if not downloaded_url:
             status.update_status("Kunde inte ladda ner bilden")
             time.sleep(2)
             status.close()
             sys.exit(1)
+        # Historiken får bilden som faktiskt hämtades, även om en reservbild vann
+        scraper.record_used(downloaded_url)
 
+        mark_stage('nedladdning')
         status.update_status("Ställer in bakgrundsbild...")
         if set_wallpaper(cache_path):
+            _record_run(paths, cache_path)
             status.update_status("Bakgrundsbild uppdaterad!")
             logger.info("Bakgrundsbilden uppdaterades framgångsrikt.")
         else:
@@ -147,6 +308,9 @@ def main():
         except:
             pass
         sys.exit(1)
+    finally:
+        if instance:
+            instance.release()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""
+Tidsbudget för en körning.
+En körning får en samlad tidsgräns (Deadline) som delas upp mellan stegen
+(sökning, verifiering, nedladdning), så att inget enskilt steg eller
+omförsök kan dra ut på tiden obegränsat.
+"""
+
+import time
+import random
+
+MIN_TIMEOUT = 0.5  # Kortaste timeout som lämnas till ett nätverksanrop
+
+
+class Deadline:
+    """Absolut tidsgräns räknad från när objektet skapades."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Sekunder kvar till tidsgränsen (aldrig negativt)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, default: float) -> float:
+        """Timeout för ett anrop: `default`, men aldrig längre än tiden som är kvar."""
+        return max(MIN_TIMEOUT, min(default, self.remaining()))
+
+    def stage(self, share: float) -> 'Deadline':
+        """
+        Skapar en deltidsgräns för ett steg som får använda andelen `share`
+        av den tid som återstår, så att resten finns kvar för senare steg.
+        """
+        return Deadline(self.remaining() * max(0.0, min(1.0, share)))
+
+    def __repr__(self):
+        return f"Deadline({self.remaining():.1f}/{self.seconds:.1f} s kvar)"
+
+
+def backoff_delay(attempt: int, base: float = 2.0, cap: float = 30.0) -> float:
+    """
+    Väntetid före omförsök nummer `attempt` (0 = första omförsöket):
+    exponentiell backoff med full jitter, dvs slumpmässigt mellan 0 och
+    min(cap, base * 2^attempt), så att samtidiga körningar inte försöker i takt.
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,160 @@
+"""
+Hälsotabell per bildvärd med circuit breaker.
+Sparar för varje värd en glidande medelsvarstid (EWMA), felandel och senaste
+fel i host_health.json. Värdar som upprepat misslyckas stängs av under en
+avsvalningsperiod, och timeouts väljs utifrån värdens uppmätta svarstid.
+"""
+
+import time
+import logging
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from utils.locking import FileLock, read_json, atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+EWMA_ALPHA = 0.3            # Vikt för senaste mätningen
+MIN_TIMEOUT = 3.0           # Kortaste timeout som väljs från uppmätt svarstid
+TIMEOUT_FACTOR = 4.0        # Timeout = medelsvarstid * faktor + 1 s
+UNHEALTHY_FAILURE_RATE = 0.3  # Värdar över denna felandel prövas sist
+MAX_COOLDOWN_FACTOR = 16    # Avsvalningen dubblas vid upprepade avbrott, upp till 16x
+MAX_HOSTS = 500             # Äldsta värdarna rensas bort över denna gräns
+
+
+def host_of(url: str) -> str:
+    return (urlparse(url).hostname or '').lower()
+
+
+class HostHealthTable:
+    """Beständig hälsostatistik per värd, delad mellan processer via fillås."""
+
+    def __init__(self, state_file: str, cooldown: float = 1800.0, failure_threshold: int = 3):
+        self.state_file = state_file
+        self.cooldown = cooldown
+        self.failure_threshold = failure_threshold
+        self.lock = FileLock(state_file + '.lock')
+        self._mutex = threading.Lock()
+        self._hosts: Dict[str, Dict] = {}
+        self._dirty = set()
+        self._load()
+
+    def _load(self):
+        data = read_json(self.state_file, {})
+        if isinstance(data, dict):
+            self._hosts = {host: entry for host, entry in data.items() if isinstance(entry, dict)}
+
+    def _entry(self, host: str) -> Dict:
+        return self._hosts.setdefault(host, {
+            'latency': None,
+            'failure_rate': 0.0,
+            'consecutive_failures': 0,
+            'trips': 0,
+            'open_until': 0.0,
+            'last_error': '',
+            'last_seen': 0.0,
+        })
+
+    # --- Frågor ---
+
+    def is_open(self, url: str) -> bool:
+        """True om värdens circuit breaker är öppen (värden ska hoppas över)."""
+        with self._mutex:
+            entry = self._hosts.get(host_of(url))
+            return bool(entry) and entry.get('open_until', 0.0) > time.time()
+
+    def is_unhealthy(self, url: str) -> bool:
+        """True om värden ofta misslyckas och bör prövas efter friska värdar."""
+        with self._mutex:
+            entry = self._hosts.get(host_of(url))
+            return bool(entry) and entry.get('failure_rate', 0.0) >= UNHEALTHY_FAILURE_RATE
+
+    def timeout_for(self, url: str, default: float) -> float:
+        """Väljer timeout utifrån värdens uppmätta svarstid, högst `default`."""
+        with self._mutex:
+            entry = self._hosts.get(host_of(url))
+            latency = entry.get('latency') if entry else None
+        if latency is None:
+            return default
+        return max(MIN_TIMEOUT, min(default, latency * TIMEOUT_FACTOR + 1.0))
+
+    # --- Uppdateringar ---
+
+    def record_success(self, url: str, latency: float):
+        """Registrerar ett lyckat anrop och stänger värdens circuit breaker."""
+        host = host_of(url)
+        with self._mutex:
+            entry = self._entry(host)
+            previous = entry['latency']
+            entry['latency'] = latency if previous is None else (
+                EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * previous
+            )
+            entry['failure_rate'] = (1 - EWMA_ALPHA) * entry['failure_rate']
+            entry['consecutive_failures'] = 0
+            entry['trips'] = 0
+            entry['open_until'] = 0.0
+            entry['last_seen'] = time.time()
+            self._dirty.add(host)
+
+    def record_failure(self, url: str, error: str, latency: Optional[float] = None):
+        """Registrerar ett misslyckat anrop och öppnar vid behov värdens circuit breaker."""
+        host = host_of(url)
+        now = time.time()
+        with self._mutex:
+            entry = self._entry(host)
+            if latency is not None:
+                previous = entry['latency']
+                entry['latency'] = latency if previous is None else (
+                    EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * previous
+                )
+            entry['failure_rate'] = EWMA_ALPHA + (1 - EWMA_ALPHA) * entry['failure_rate']
+            entry['consecutive_failures'] += 1
+            entry['last_error'] = error[:200]
+            entry['last_seen'] = now
+
+            if entry['consecutive_failures'] >= self.failure_threshold:
+                entry['trips'] += 1
+                factor = min(MAX_COOLDOWN_FACTOR, 2 ** (entry['trips'] - 1))
+                entry['open_until'] = now + self.cooldown * factor
+                # Nästa försök efter avsvalningen räknas som provanrop
+                entry['consecutive_failures'] = self.failure_threshold - 1
+                logger.warning(
+                    f"Värd {host} avstängd i {self.cooldown * factor / 60:.0f} min "
+                    f"efter upprepade fel ({entry['last_error']})"
+                )
+            self._dirty.add(host)
+
+    def record_request_error(self, url: str, error: Exception):
+        """
+        Registrerar ett fel från requests. Nätverksfel, timeouts, 403/429 och
+        serverfel räknas mot värden; t.ex. 404 gäller bara den enskilda URL:en.
+        """
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+        if status is None or status in (403, 429) or status >= 500:
+            self.record_failure(url, str(error))
+
+    def save(self):
+        """Sparar ändrade värdar; andra processers uppdateringar av övriga värdar behålls."""
+        with self._mutex:
+            if not self._dirty:
+                return
+            changed = {host: dict(self._hosts[host]) for host in self._dirty}
+            self._dirty.clear()
+
+        try:
+            with self.lock:
+                data = read_json(self.state_file, {})
+                if not isinstance(data, dict):
+                    data = {}
+                data.update(changed)
+                if len(data) > MAX_HOSTS:
+                    newest = sorted(data.items(), key=lambda item: item[1].get('last_seen', 0), reverse=True)
+                    data = dict(newest[:MAX_HOSTS])
+                atomic_write_json(self.state_file, data)
+            with self._mutex:
+                for host, entry in data.items():
+                    if host not in self._dirty:
+                        self._hosts[host] = entry
+        except Exception as e:
+            logger.warning(f"Kunde inte spara värdhälsa: {str(e)}")
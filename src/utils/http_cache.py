@@ -0,0 +1,389 @@
+"""
+HTTP-cache på disk för sökresultat och bildverifiering.
+- Färska svar serveras direkt från disk
+- Inaktuella svar förnyas med If-None-Match/If-Modified-Since (304 = återanvänd)
+- Negativa svar (404/410) och egna utslag (t.ex. "för liten bild") sparas med TTL
+- Cachens totala storlek (kroppar och utslag) hålls under en gräns genom att
+  utgångna utslag och de äldst använda posterna tas bort
+
+Cachen kopplas in under requests via CachingAdapter, så att befintlig kod
+fortsätter använda vanliga sessioner.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+NEGATIVE_STATUSES = (404, 410)
+# Huvuden som inte längre stämmer när kroppen sparats avkodad
+DROPPED_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length', 'connection'}
+
+
+def _parse_http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def _cache_directives(headers) -> Dict[str, Optional[str]]:
+    directives = {}
+    for part in headers.get('Cache-Control', '').split(','):
+        name, _, value = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+class HttpCache:
+    """Storleksbegränsad cache på disk, nycklad på URL."""
+
+    def __init__(self, cache_dir: str, max_bytes: int = 200 * 1024 * 1024,
+                 default_ttl: float = 86400.0, negative_ttl: float = 86400.0):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self._mutex = threading.Lock()
+        self._size = None  # Beräknas första gången något sparas
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # --- Lagring ---
+
+    def _key(self, url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _paths(self, url: str):
+        base = os.path.join(self.cache_dir, self._key(url))
+        return base + '.json', base + '.body'
+
+    def _write_atomic(self, path: str, data: bytes):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def contains(self, url: str) -> bool:
+        """True om en post för URL:en finns sparad (utan att kroppen läses)."""
+        return all(os.path.exists(path) for path in self._paths(url))
+
+    def lookup(self, url: str) -> Optional[Dict]:
+        """Returnerar sparad post (metadata + kropp) för URL:en, eller None."""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('url') != url:
+                return None
+            with open(body_path, 'rb') as f:
+                meta['body'] = f.read()
+            # Markera som nyligen använd för LRU-rensningen
+            os.utime(meta_path)
+            return meta
+        except (OSError, ValueError):
+            return None
+
+    def store(self, url: str, status: int, headers, body: bytes, ttl: float, **extra):
+        """Sparar ett svar. Metadatafilen skrivs sist och fungerar som commit."""
+        if len(body) > self.max_bytes // 10:
+            return
+        meta_path, body_path = self._paths(url)
+        now = time.time()
+        meta = {
+            'url': url,
+            'status': status,
+            'headers': {k: v for k, v in headers.items() if k.lower() not in DROPPED_HEADERS},
+            'stored_at': now,
+            'expires_at': now + ttl,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'size': len(body),
+        }
+        meta.update(extra)
+        try:
+            previous = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+            self._write_atomic(body_path, body)
+            self._write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+            self._account(len(body) - previous)
+        except OSError as e:
+            logger.warning(f"Kunde inte spara i HTTP-cachen: {str(e)}")
+
+    def refresh(self, entry: Dict, headers, ttl: float):
+        """Förlänger en post efter 304 Not Modified."""
+        meta_path, _ = self._paths(entry['url'])
+        meta = {k: v for k, v in entry.items() if k != 'body'}
+        meta['stored_at'] = time.time()
+        meta['expires_at'] = meta['stored_at'] + ttl
+        for name, key in (('ETag', 'etag'), ('Last-Modified', 'last_modified')):
+            if headers.get(name):
+                meta[key] = headers[name]
+        try:
+            self._write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+        except OSError as e:
+            logger.warning(f"Kunde inte förnya post i HTTP-cachen: {str(e)}")
+
+    # --- Storleksgräns ---
+
+    def _account(self, delta: int):
+        with self._mutex:
+            if self._size is None:
+                self._size = sum(
+                    entry.stat().st_size for entry in os.scandir(self.cache_dir)
+                    if entry.name.endswith(('.body', '.verdict'))
+                )
+            else:
+                self._size += delta
+            if self._size <= self.max_bytes:
+                return
+            self._evict()
+
+    def _evict(self):
+        """
+        Tar bort utgångna utslag och därefter de äldst använda posterna och
+        utslagen tills cachen är under 90 % av gränsen.
+        """
+        entries = []
+        removed = 0
+        now = time.time()
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.json'):
+                body_path = entry.path[:-5] + '.body'
+                try:
+                    size = os.path.getsize(body_path)
+                except OSError:
+                    size = 0
+                entries.append((entry.stat().st_mtime, (entry.path, body_path), size))
+            elif entry.name.endswith('.verdict'):
+                if self._read_verdict(entry.path).get('expires_at', 0) < now:
+                    self._remove(entry.path)
+                    removed += 1
+                    continue
+                entries.append((entry.stat().st_mtime, (entry.path,), entry.stat().st_size))
+        entries.sort()
+
+        total = sum(e[2] for e in entries)
+        target = self.max_bytes * 0.9
+        for _, paths, size in entries:
+            if total <= target:
+                break
+            for path in paths:
+                self._remove(path)
+            total -= size
+            removed += 1
+        self._size = total
+        logger.info(f"HTTP-cachen rensad: {removed} poster borttagna, {total / 1e6:.1f} MB kvar")
+
+    # --- Färskhet ---
+
+    def freshness_ttl(self, status: int, headers) -> Optional[float]:
+        """
+        Räknar ut hur länge ett svar är färskt. None betyder att det inte får sparas.
+        Följer Cache-Control/Expires; saknas båda används default_ttl.
+        """
+        if status in NEGATIVE_STATUSES:
+            return self.negative_ttl
+        if status != 200:
+            return None
+
+        # Cachen är privat för den här datorn, så även "private"-svar får sparas
+        directives = _cache_directives(headers)
+        if 'no-store' in directives:
+            return None
+        if 'no-cache' in directives:
+            return 0.0
+        for name in ('s-maxage', 'max-age'):
+            if directives.get(name) and re.fullmatch(r'\d+', directives[name]):
+                return float(directives[name])
+
+        expires = _parse_http_date(headers.get('Expires'))
+        if expires is not None:
+            date = _parse_http_date(headers.get('Date')) or time.time()
+            return max(0.0, expires - date)
+
+        return self.default_ttl
+
+    # --- Utslag från verifieringen ---
+
+    def _verdict_path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, self._key(url) + '.verdict')
+
+    @staticmethod
+    def _read_verdict(path: str) -> Dict:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    @staticmethod
+    def _remove(path: str) -> int:
+        """Tar bort en fil och returnerar dess storlek (0 om den inte fanns)."""
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except OSError:
+            return 0
+
+    def remember_verdict(self, url: str, verdict: str, ttl: Optional[float] = None):
+        """Sparar att en URL underkänts (t.ex. för liten bild) så att den inte hämtas igen."""
+        ttl = self.negative_ttl if ttl is None else ttl
+        data = json.dumps({'url': url, 'verdict': verdict, 'expires_at': time.time() + ttl}).encode('utf-8')
+        path = self._verdict_path(url)
+        try:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            self._write_atomic(path, data)
+            self._account(len(data) - previous)
+        except OSError as e:
+            logger.warning(f"Kunde inte spara utslag i HTTP-cachen: {str(e)}")
+
+    def get_verdict(self, url: str) -> Optional[str]:
+        """Returnerar ett sparat, fortfarande giltigt utslag för URL:en."""
+        path = self._verdict_path(url)
+        data = self._read_verdict(path)
+        if data.get('url') != url:
+            return None
+        if data.get('expires_at', 0) < time.time():
+            # Utgånget utslag: ta bort filen så att den inte ligger kvar i cachen
+            size = self._remove(path)
+            if size:
+                self._account(-size)
+            return None
+        return data.get('verdict')
+
+
+class _TeeStream:
+    """
+    Omsluter svarets råström och kopierar kroppen till cachen medan den läses.
+    Posten sparas först när hela kroppen lästs; avbryts läsningen sparas inget.
+    """
+
+    def __init__(self, raw, on_complete, max_bytes: int):
+        self._raw = raw
+        self._on_complete = on_complete
+        self._max_bytes = max_bytes
+        self._chunks = []
+        self._size = 0
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def _collect(self, chunk: bytes):
+        if self._chunks is None:
+            return
+        self._size += len(chunk)
+        if self._size > self._max_bytes:
+            self._chunks = None  # För stor för cachen, läs vidare utan att spara
+        else:
+            self._chunks.append(chunk)
+
+    def _finish(self):
+        if self._chunks is not None:
+            body, self._chunks = b''.join(self._chunks), None
+            self._on_complete(body)
+
+    def stream(self, amt=None, decode_content=None):
+        for chunk in self._raw.stream(amt, decode_content=decode_content):
+            self._collect(chunk)
+            yield chunk
+        self._finish()
+
+    def read(self, amt=None, decode_content=None, **kwargs):
+        chunk = self._raw.read(amt, decode_content=decode_content, **kwargs)
+        self._collect(chunk)
+        if not chunk or amt is None:
+            self._finish()
+        return chunk
+
+
+class CachingAdapter(HTTPAdapter):
+    """HTTPAdapter som svarar från HttpCache och förnyar inaktuella poster villkorligt."""
+
+    def __init__(self, cache: HttpCache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def _cached_response(self, request, entry: Dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry.get('headers') or {})
+        response.headers['Content-Length'] = str(len(entry['body']))
+        response._content = entry['body']
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.reason = 'OK' if entry['status'] == 200 else 'Cached'
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.connection = self
+        response.from_cache = True
+        return response
+
+    def send(self, request, **kwargs):
+        conditional = 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers
+        if request.method != 'GET' or conditional:
+            return super().send(request, **kwargs)
+
+        entry = self.cache.lookup(request.url)
+        if entry and entry['expires_at'] > time.time():
+            return self._cached_response(request, entry)
+
+        if entry:
+            if entry.get('etag'):
+                request.headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                request.headers['If-Modified-Since'] = entry['last_modified']
+
+        response = super().send(request, **kwargs)
+        response.from_cache = False
+
+        if response.status_code == 304 and entry:
+            # Servern bekräftar att posten är oförändrad; nya cache-huvuden gäller
+            ttl = self.cache.freshness_ttl(200, response.headers) or 0.0
+            self.cache.refresh(entry, response.headers, ttl)
+            response.close()
+            cached = self._cached_response(request, entry)
+            cached.from_cache = False  # Svarstiden är en riktig nätverksmätning
+            return cached
+
+        ttl = self.cache.freshness_ttl(response.status_code, response.headers)
+        if ttl is None or not (ttl > 0 or response.headers.get('ETag') or response.headers.get('Last-Modified')):
+            return response
+
+        url, status, headers = request.url, response.status_code, response.headers
+        if status in NEGATIVE_STATUSES:
+            # Små felsvar läses direkt, eftersom anroparen oftast aldrig läser kroppen
+            self.cache.store(url, status, headers, response.content, ttl)
+        else:
+            # Kroppen sparas medan anroparen läser den, så att strömmande läsning
+            # (t.ex. nedladdningens taktmätning) fungerar även via cachen
+            response.raw = _TeeStream(
+                response.raw,
+                lambda body: self.cache.store(url, status, headers, body, ttl),
+                self.cache.max_bytes // 10,
+            )
+        return response
+
+
+def create_cached_session(cache: Optional[HttpCache]) -> requests.Session:
+    """Skapar en requests-session som går via HTTP-cachen (om en cache anges)."""
+    session = requests.Session()
+    if cache is not None:
+        adapter = CachingAdapter(cache)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+    return session
@@ -0,0 +1,232 @@
+"""
+Kvalitetsbedömning av bildkandidater med NumPy.
+Varje kandidat avkodas i låg upplösning (JPEG-draft) och alla kandidater
+bedöms sedan tillsammans i en vektoriserad batch:
+- Skärpa (varians av Laplace-filtret i 512x288, innan oskärpa döljs av nedskalningen)
+- Färgrikedom (Hasler & Süsstrunk)
+- Entropi i gråskalehistogrammet
+- Uppskattade JPEG-artefakter (kvantiseringstabell / bitar per pixel)
+"""
+
+import time
+import random
+import logging
+from io import BytesIO
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Storlek som alla kandidater skalas ner till innan bedömning
+SAMPLE_SIZE = (256, 144)
+# Skärpan mäts i högre upplösning; vid 256x144 ser en suddig bild nästan skarp ut
+DETAIL_SIZE = (512, 288)
+
+# Icke-JPEG-bilder kan inte draft-skalas och avkodas bara upp till ungefär 1920x1080
+MAX_FULL_DECODE_PIXELS = 2_100_000
+
+# Uppskattad CPU-kostnad för avkodningen, mätt med tools/bench_image_quality.py.
+# För JPEG dominerar entropiavkodningen, som följer filstorleken snarare än
+# antalet pixlar; övriga format avkodas i full upplösning.
+DECODE_OVERHEAD_MS = 8.0
+JPEG_MS_PER_MB = 15.0
+FULL_DECODE_MS_PER_MEGAPIXEL = 60.0
+
+DEFAULT_WEIGHTS = {
+    'sharpness': 0.35,
+    'colorfulness': 0.15,
+    'entropy': 0.2,
+    'artifacts': 0.3,
+}
+
+# Referensvärden för att normalisera råvärdena till 0..1, kalibrerade mot
+# testbilderna i tools/bench_image_quality.py (Laplace-varians i DETAIL_SIZE:
+# skarp ~1400, suddig ~16)
+SHARPNESS_REFERENCE = 1000.0   # Laplace-varians för en tydligt skarp bild
+COLORFULNESS_REFERENCE = 100.0  # "Mycket färgrik" enligt Hasler & Süsstrunk
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+class ImageSample:
+    """Nedskalad avkodning av en kandidat och dess artefaktuppskattning."""
+
+    __slots__ = ('pixels', 'detail', 'artifacts')
+
+    def __init__(self, pixels: np.ndarray, detail: np.ndarray, artifacts: float):
+        self.pixels = pixels
+        self.detail = detail  # Gråskala i DETAIL_SIZE för skärpemåttet
+        self.artifacts = artifacts
+
+
+def estimate_artifacts(img: Image.Image, data_size: int) -> float:
+    """
+    Uppskattar komprimeringsartefakter (0 = inga, 1 = kraftiga).
+    För JPEG används luminans-kvantiseringstabellen: standardtabellen vid
+    kvalitet 50 har medelvärde ~58, vid kvalitet 95 ~3. För övriga förlustformat
+    används antalet bitar per pixel.
+    """
+    tables = getattr(img, 'quantization', None)
+    if tables:
+        luma = tables.get(0) or next(iter(tables.values()))
+        return float(np.clip(np.mean(luma) / 60.0, 0.0, 1.0))
+
+    if img.format in ('WEBP', 'AVIF'):
+        width, height = img.size
+        bits_per_pixel = data_size * 8.0 / max(1, width * height)
+        return float(np.clip(1.0 - bits_per_pixel / 1.5, 0.0, 1.0))
+
+    return 0.0
+
+
+def estimate_decode_ms(img: Image.Image, data_size: int) -> float:
+    """Uppskattar CPU-tiden för decode_sample utifrån bildhuvudet, innan något avkodas."""
+    if img.format == 'JPEG':
+        return DECODE_OVERHEAD_MS + JPEG_MS_PER_MB * data_size / 1e6
+    width, height = img.size
+    return DECODE_OVERHEAD_MS + FULL_DECODE_MS_PER_MEGAPIXEL * width * height / 1e6
+
+
+def decode_sample(data: bytes, size=SAMPLE_SIZE, budget_ms: Optional[float] = None) -> Optional[ImageSample]:
+    """
+    Avkodar en bild i låg upplösning för kvalitetsbedömning.
+    JPEG-bilder skalas redan i avkodaren (draft) så att arbetet per kandidat
+    blir litet och förutsägbart oavsett originalstorlek. Skärpeunderlaget tas
+    i DETAIL_SIZE innan bilden skalas ner till `size`. Bilder vars uppskattade
+    avkodning inte ryms i `budget_ms` hoppas över (None).
+    """
+    try:
+        img = Image.open(BytesIO(data))
+        artifacts = estimate_artifacts(img, len(data))
+
+        if img.format != 'JPEG' and img.size[0] * img.size[1] > MAX_FULL_DECODE_PIXELS:
+            logger.info(f"Hoppar över kvalitetsbedömning av stor {img.format}-bild")
+            return None
+        if budget_ms is not None:
+            estimate = estimate_decode_ms(img, len(data))
+            if estimate > budget_ms:
+                logger.info(f"Hoppar över kvalitetsbedömning av {img.format}-bild "
+                            f"(uppskattat {estimate:.0f} ms, budget {budget_ms:.0f} ms)")
+                return None
+        if img.format == 'JPEG':
+            img.draft('RGB', DETAIL_SIZE)
+
+        detail = img.convert('RGB').resize(DETAIL_SIZE, Image.BILINEAR)
+        pixels = detail.resize(size, Image.BILINEAR)
+        return ImageSample(
+            np.asarray(pixels, dtype=np.uint8), np.asarray(detail.convert('L'), dtype=np.uint8), artifacts
+        )
+    except Exception as e:
+        logger.warning(f"Kunde inte avkoda bild för kvalitetsbedömning: {str(e)}")
+        return None
+
+
+def compute_features(samples: Sequence[ImageSample]) -> Dict[str, np.ndarray]:
+    """
+    Beräknar normaliserade kvalitetsmått (0..1) för alla kandidater i en batch.
+
+    Returns:
+        Dict[str, np.ndarray]: Ett värde per kandidat för varje mått
+    """
+    batch = np.stack([s.pixels for s in samples]).astype(np.float32)  # (N, H, W, 3)
+    count = batch.shape[0]
+    gray = batch @ LUMA_WEIGHTS  # (N, H, W)
+
+    # Skärpa: varians av 4-grannars Laplace-filter på detaljbilderna
+    detail = np.stack([s.detail for s in samples]).astype(np.float32)
+    laplacian = (
+        detail[:, :-2, 1:-1] + detail[:, 2:, 1:-1] + detail[:, 1:-1, :-2] + detail[:, 1:-1, 2:]
+        - 4.0 * detail[:, 1:-1, 1:-1]
+    )
+    sharpness = np.log1p(laplacian.var(axis=(1, 2))) / np.log1p(SHARPNESS_REFERENCE)
+
+    # Färgrikedom enligt Hasler & Süsstrunk
+    red, green, blue = batch[..., 0], batch[..., 1], batch[..., 2]
+    rg = (red - green).reshape(count, -1)
+    yb = (0.5 * (red + green) - blue).reshape(count, -1)
+    colorfulness = (
+        np.hypot(rg.std(axis=1), yb.std(axis=1))
+        + 0.3 * np.hypot(rg.mean(axis=1), yb.mean(axis=1))
+    ) / COLORFULNESS_REFERENCE
+
+    # Entropi: ett histogram per bild via en gemensam bincount
+    levels = np.clip(gray, 0, 255).astype(np.int64).reshape(count, -1)
+    offsets = (np.arange(count, dtype=np.int64) * 256)[:, None]
+    histograms = np.bincount((levels + offsets).ravel(), minlength=count * 256).reshape(count, 256)
+    probabilities = histograms / levels.shape[1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entropy = -np.where(probabilities > 0, probabilities * np.log2(probabilities), 0.0).sum(axis=1) / 8.0
+
+    artifacts = np.array([s.artifacts for s in samples], dtype=np.float32)
+
+    return {
+        'sharpness': np.clip(sharpness, 0.0, 1.0),
+        'colorfulness': np.clip(colorfulness, 0.0, 1.0),
+        'entropy': np.clip(entropy, 0.0, 1.0),
+        'artifacts': np.clip(artifacts, 0.0, 1.0),
+    }
+
+
+class ImageQualityScorer:
+    """
+    Samlar nedskalade kandidater och rangordnar dem efter viktad kvalitet.
+    `randomness` (0..1) blandar in slump så att inte samma typ av bild alltid vinner.
+    Varje kandidat har en egen fast CPU-budget för avkodningen; kandidater vars
+    uppskattade kostnad inte ryms får medianbetyget av de bedömda kandidaterna,
+    så att en dyr bild varken straffas eller påverkar de andra.
+    """
+
+    NEUTRAL_SCORE = 0.5
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None, randomness: float = 0.3,
+                 cpu_budget_ms: float = 60.0):
+        self.weights = dict(DEFAULT_WEIGHTS)
+        if weights:
+            self.weights.update(weights)
+        self.randomness = float(np.clip(randomness, 0.0, 1.0))
+        self.cpu_budget = cpu_budget_ms / 1000.0
+        self._samples: List[Optional[ImageSample]] = []
+
+    def add(self, data: bytes) -> int:
+        """
+        Lägger till en kandidat (rå bilddata) och returnerar dess index.
+        Avkodning sker bara om den uppskattade kostnaden ryms i kandidatens budget.
+        """
+        index = len(self._samples)
+        started = time.thread_time()
+        self._samples.append(decode_sample(data, budget_ms=self.cpu_budget * 1000))
+        used = time.thread_time() - started
+        if used > self.cpu_budget * 1.5:
+            logger.debug(f"Avkodningen tog {used * 1000:.0f} ms, budget {self.cpu_budget * 1000:.0f} ms")
+        return index
+
+    def scores(self) -> np.ndarray:
+        """Returnerar viktat kvalitetsbetyg (0..1) för alla tillagda kandidater."""
+        scores = np.full(len(self._samples), self.NEUTRAL_SCORE, dtype=np.float32)
+        decoded = [i for i, s in enumerate(self._samples) if s is not None]
+        if not decoded:
+            return scores
+
+        features = compute_features([self._samples[i] for i in decoded])
+        total_weight = sum(self.weights.values()) or 1.0
+        combined = (
+            self.weights['sharpness'] * features['sharpness']
+            + self.weights['colorfulness'] * features['colorfulness']
+            + self.weights['entropy'] * features['entropy']
+            + self.weights['artifacts'] * (1.0 - features['artifacts'])
+        ) / total_weight
+        scores[decoded] = combined
+        # Överhoppade kandidater varken gynnas eller missgynnas
+        scores[[i for i, s in enumerate(self._samples) if s is None]] = float(np.median(combined))
+        return scores
+
+    def ranking(self) -> List[int]:
+        """Returnerar kandidaternas index sorterade från bäst till sämst."""
+        scores = self.scores()
+        noise = np.array([random.random() for _ in range(len(scores))], dtype=np.float32)
+        final = (1.0 - self.randomness) * scores + self.randomness * noise
+        order = [int(i) for i in np.argsort(-final, kind='stable')]
+        for rank, i in enumerate(order):
+            logger.info(f"Kvalitet #{rank + 1}: kandidat {i} betyg {scores[i]:.3f}")
+        return order
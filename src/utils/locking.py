@@ -0,0 +1,164 @@
+"""
+Fillåsning mellan processer, atomisk skrivning av JSON-filer och skydd mot
+att flera instanser av programmet kör samtidigt.
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLock:
+    """
+    Exklusivt lås på en fil som delas mellan processer.
+    Använder msvcrt.locking på Windows och fcntl.flock på övriga system.
+    Låset släpps automatiskt av operativsystemet om processen dör.
+    """
+
+    def __init__(self, path: str, timeout: float = 10.0, poll_interval: float = 0.05):
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._file = None
+
+    @property
+    def is_locked(self) -> bool:
+        return self._file is not None
+
+    def _try_lock(self) -> bool:
+        """Försöker ta låset en gång utan att vänta."""
+        handle = open(self.path, 'a+b')
+        try:
+            if os.name == 'nt':
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._file = handle
+        return True
+
+    def acquire(self, blocking: bool = True, timeout: Optional[float] = None) -> bool:
+        """
+        Tar låset.
+
+        Args:
+            blocking (bool): Vänta tills låset blir ledigt om det är upptaget
+            timeout (float): Max väntetid i sekunder (standard: self.timeout)
+
+        Returns:
+            bool: True om låset togs, False om det var upptaget
+        """
+        if self._file is not None:
+            return True
+
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            if self._try_lock():
+                return True
+            if not blocking or time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+
+    def release(self):
+        """Släpper låset om det är taget."""
+        if self._file is None:
+            return
+        try:
+            if os.name == 'nt':
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        except OSError as e:
+            logger.warning(f"Kunde inte släppa fillås {self.path}: {e}")
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        if not self.acquire():
+            raise TimeoutError(f"Kunde inte låsa {self.path} inom {self.timeout} s")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def read_json(path: str, default: Any = None) -> Any:
+    """Läser en JSON-fil och returnerar default om filen saknas eller är trasig."""
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, json.JSONDecodeError):
+        return default
+
+
+def atomic_write_json(path: str, data: Any):
+    """
+    Skriver JSON till en temporär fil i samma katalog och byter sedan ut
+    målfilen med os.replace, så att läsare aldrig ser en halvskriven fil.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', suffix='.json', dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False)
+            file.flush()
+            os.fsync(file.fileno())
+
+        # På Windows kan os.replace misslyckas tillfälligt om en annan
+        # process har målfilen öppen för läsning
+        for attempt in range(5):
+            try:
+                os.replace(tmp_path, path)
+                return
+            except PermissionError:
+                if attempt == 4:
+                    raise
+                time.sleep(0.05)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class SingleInstance:
+    """
+    Säkerställer att bara en instans av programmet hämtar bilder åt gången.
+    En andra instans kan vänta på att den pågående körningen blir klar i
+    stället för att starta en egen webbläsare.
+    """
+
+    def __init__(self, lock_path: str):
+        self._lock = FileLock(lock_path)
+
+    def try_acquire(self) -> bool:
+        """Tar instanslåset utan att vänta."""
+        return self._lock.acquire(blocking=False)
+
+    def wait(self, timeout: float) -> bool:
+        """Väntar tills den pågående instansen är klar och tar sedan låset."""
+        return self._lock.acquire(blocking=True, timeout=timeout)
+
+    def release(self):
+        self._lock.release()
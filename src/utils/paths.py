@@ -28,18 +28,10 @@ def get_app_paths() -> Dict[str, str]:
     Returns:
         Dict[str, str]: Dictionary med alla viktiga sökvägar
     """
+    base_dir = get_executable_dir()
     try:
         # Basera alla sökvägar på exe-mappen
-        base_dir = get_executable_dir()
-        
-        paths = {
-            # Alla filer sparas i samma mapp som exe-filen
-            'program_data': base_dir,
-            'history_file': os.path.join(base_dir, 'history.json'),
-            'logs_dir': os.path.join(base_dir, 'logs'),
-            'cache_dir': os.path.join(base_dir, 'cache'),
-            'daily_count_file': os.path.join(base_dir, 'daily_search_count.json'),
-        }
+        paths = _build_paths(base_dir)
         
         # Skapa alla mappar
         for path in [paths['logs_dir'], paths['cache_dir']]:
@@ -51,13 +43,27 @@ def get_app_paths() -> Dict[str, str]:
         
     except Exception as e:
         logger.error(f"Fel vid skapande av applikationsmappar: {str(e)}")
-        return {
-            'program_data': base_dir,
-            'history_file': os.path.join(base_dir, 'history.json'),
-            'logs_dir': os.path.join(base_dir, 'logs'),
-            'cache_dir': os.path.join(base_dir, 'cache'),
-            'daily_count_file': os.path.join(base_dir, 'daily_search_count.json'),
-        }
+        return _build_paths(base_dir)
+
+def _build_paths(base_dir: str) -> Dict[str, str]:
+    """Bygger sökvägsdictionaryn utifrån programmappen."""
+    # Alla filer sparas i samma mapp som exe-filen
+    return {
+        'program_data': base_dir,
+        'settings_file': os.path.join(base_dir, 'settings.ini'),
+        'history_file': os.path.join(base_dir, 'history.json'),
+        'logs_dir': os.path.join(base_dir, 'logs'),
+        'cache_dir': os.path.join(base_dir, 'cache'),
+        'http_cache_dir': os.path.join(base_dir, 'cache', 'http'),
+        'daily_count_file': os.path.join(base_dir, 'daily_search_count.json'),
+        'instance_lock_file': os.path.join(base_dir, 'search_wallpaper.lock'),
+        'last_run_file': os.path.join(base_dir, 'last_run.json'),
+        'host_health_file': os.path.join(base_dir, 'host_health.json'),
+        'harvest_progress_file': os.path.join(base_dir, 'harvest_progress.json'),
+        'harvest_lock_file': os.path.join(base_dir, 'harvest.lock'),
+        'lan_library_file': os.path.join(base_dir, 'lan_library.json'),
+        'wallpaper_state_file': os.path.join(base_dir, 'wallpaper_state.json'),
+    }
 
 def is_admin() -> bool:
     """
@@ -0,0 +1,222 @@
+"""
+Inbyggd profilering av en körning (--profile eller [Profiling] i settings.ini).
+Skriver till logs-mappen, med samma namnprefix per körning:
+- profile_<tid>.prof        cProfile/pstats-dump (pstats, snakeviz)
+- profile_<tid>.folded      Stackar i "collapsed"-format (speedscope, flamegraph.pl)
+- profile_<tid>.memory.txt  tracemalloc: största allokeringarna per steg (valfritt)
+Bara de senaste körningarnas filer behålls.
+"""
+
+import os
+import sys
+import time
+import cProfile
+import pstats
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+TOP_ALLOCATIONS = 15
+MAX_STACK_DEPTH = 64
+
+# Profileraren för den pågående körningen, så att mark_stage kan anropas var som helst
+_active: Optional['RunProfiler'] = None
+
+
+def mark_stage(name: str):
+    """Markerar att körningen nått ett nytt steg (gör inget om profilering är avstängd)."""
+    if _active is not None:
+        _active.mark(name)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RunProfiler:
+    """Profilerar en hel körning: cProfile för alla trådar, stacksampling och minne."""
+
+    def __init__(self, output_dir: str, trace_memory: bool = False, keep_runs: int = 5,
+                 sample_interval: float = 0.01):
+        self.output_dir = output_dir
+        self.trace_memory = trace_memory
+        self.keep_runs = max(1, keep_runs)
+        self.sample_interval = sample_interval
+        self.run_id = f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+
+        self._profile = cProfile.Profile()
+        # cProfile följer bara tråden som startade den; övriga trådar får egna profiler
+        self._thread_profiles: List[cProfile.Profile] = []
+        self._mutex = threading.Lock()
+        self._stacks = Counter()
+        self._stop_sampling = threading.Event()
+        self._sampler = None
+        self._stages = []
+        self._started = 0.0
+
+    # --- Start och stopp ---
+
+    def start(self):
+        global _active
+        _active = self
+        self._started = time.perf_counter()
+        if self.trace_memory:
+            tracemalloc.start(10)
+        threading.setprofile(self._profile_new_thread)
+        self._sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+        self._sampler.start()
+        self._profile.enable()
+        logger.info(f"Profilering startad ({self.run_id})")
+
+    def _profile_new_thread(self, frame, event, arg):
+        """Körs första gången en ny tråd anropar en funktion och startar trådens egen profil."""
+        sys.setprofile(None)
+        if threading.current_thread() is self._sampler:
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Nyare Python tillåter bara en aktiv cProfile; stacksamplingen täcker tråden ändå
+            return
+        with self._mutex:
+            self._thread_profiles.append(profile)
+
+    def mark(self, stage: str):
+        """Sparar tid och (om påslaget) en minnesbild för steget."""
+        elapsed = time.perf_counter() - self._started
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        self._stages.append((stage, elapsed, snapshot))
+        logger.info(f"Profilering: steg '{stage}' efter {elapsed:.2f} s")
+
+    def stop(self) -> List[str]:
+        """Stoppar profileringen, skriver filerna och rensar gamla körningar."""
+        global _active
+        self._profile.disable()
+        threading.setprofile(None)
+        self._stop_sampling.set()
+        if self._sampler is not None:
+            self._sampler.join(timeout=1)
+        if _active is self:
+            _active = None
+
+        self.mark('slut')
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        written = []
+        os.makedirs(self.output_dir, exist_ok=True)
+        for writer in (self._write_pstats, self._write_folded, self._write_memory):
+            try:
+                path = writer()
+                if path:
+                    written.append(path)
+            except Exception as e:
+                logger.error(f"Kunde inte skriva profil ({writer.__name__}): {str(e)}")
+        self._prune()
+
+        for path in written:
+            logger.info(f"Profil sparad: {path}")
+        return written
+
+    # --- Insamling ---
+
+    def _sample(self):
+        """Samplar alla trådars anropsstackar med jämna mellanrum."""
+        own_ident = threading.get_ident()
+        while not self._stop_sampling.wait(self.sample_interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"tråd-{ident}"))
+                self._stacks[';'.join(reversed(stack))] += 1
+
+    # --- Utdata ---
+
+    def _path(self, suffix: str) -> str:
+        return os.path.join(self.output_dir, self.run_id + suffix)
+
+    def _write_pstats(self) -> str:
+        stats = pstats.Stats(self._profile)
+        with self._mutex:
+            thread_profiles = list(self._thread_profiles)
+        for profile in thread_profiles:
+            try:
+                stats.add(profile)
+            except (TypeError, ValueError):
+                pass  # Tråden hann aldrig registrera något
+        path = self._path('.prof')
+        stats.dump_stats(path)
+        return path
+
+    def _write_folded(self) -> Optional[str]:
+        if not self._stacks:
+            return None
+        path = self._path('.folded')
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def _write_memory(self) -> Optional[str]:
+        stages = [(name, elapsed, snap) for name, elapsed, snap in self._stages if snap is not None]
+        if not stages:
+            return None
+        path = self._path('.memory.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            previous = None
+            for name, elapsed, snapshot in stages:
+                total = sum(stat.size for stat in snapshot.statistics('filename'))
+                f.write(f"=== {name} ({elapsed:.2f} s, {total / 1e6:.1f} MB allokerat) ===\n")
+                f.write("Största allokeringarna:\n")
+                for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                    f.write(f"  {stat}\n")
+                if previous is not None:
+                    f.write("Störst ökning sedan föregående steg:\n")
+                    for stat in snapshot.compare_to(previous, 'lineno')[:TOP_ALLOCATIONS]:
+                        f.write(f"  {stat}\n")
+                f.write("\n")
+                previous = snapshot
+        return path
+
+    def _prune(self):
+        """Tar bort profilfiler från äldre körningar utöver keep_runs."""
+        try:
+            runs = {}
+            for name in os.listdir(self.output_dir):
+                if name.startswith('profile_'):
+                    runs.setdefault(name.split('.', 1)[0], []).append(name)
+            for run_id in sorted(runs, reverse=True)[self.keep_runs:]:
+                for name in runs[run_id]:
+                    os.remove(os.path.join(self.output_dir, name))
+        except OSError as e:
+            logger.warning(f"Kunde inte rensa gamla profiler: {str(e)}")
+
+
+def create_profiler(settings, logs_dir: str, profile: bool = False,
+                    trace_memory: bool = False) -> Optional[RunProfiler]:
+    """
+    Skapar en profilerare om profilering begärts på kommandoraden eller
+    är påslagen under [Profiling] i settings.ini, annars None.
+    """
+    profiling = settings['Profiling']
+    trace_memory = trace_memory or profiling.getboolean('trace_memory')
+    if not (profile or trace_memory or profiling.getboolean('enabled')):
+        return None
+    return RunProfiler(
+        logs_dir,
+        trace_memory=trace_memory,
+        keep_runs=profiling.getint('keep_runs'),
+        sample_interval=profiling.getfloat('sample_interval_ms') / 1000,
+    )
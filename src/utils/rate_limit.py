@@ -0,0 +1,191 @@
+"""
+Begränsning av antalet sökningar: ett fast tak per kalenderdygn och en
+token bucket per minut.
+Tillståndet sparas atomiskt i daily_search_count.json under ett fillås så
+att flera samtidiga processer delar samma budget.
+"""
+
+import time
+import datetime
+import logging
+import threading
+from typing import Dict, Optional
+
+from utils.locking import FileLock, read_json, atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """Sökbudgeten är slut; wait_seconds anger när nästa sökning tidigast får göras."""
+
+    def __init__(self, message: str, wait_seconds: float):
+        super().__init__(message)
+        self.wait_seconds = wait_seconds
+
+
+class TokenBucket:
+    """
+    Token bucket med kapacitet `capacity` som fylls på jämnt under `period` sekunder.
+    Exempel: TokenBucket(50, 86400) ger 50 sökningar per dygn.
+    """
+
+    def __init__(self, capacity: float, period: float, tokens: Optional[float] = None,
+                 updated: Optional[float] = None):
+        self.capacity = float(capacity)
+        self.period = float(period)
+        self.rate = self.capacity / self.period if self.period > 0 else float('inf')
+        self.tokens = self.capacity if tokens is None else min(float(tokens), self.capacity)
+        self.updated = time.time() if updated is None else float(updated)
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def available(self, now: Optional[float] = None) -> float:
+        """Returnerar antalet tokens som finns just nu."""
+        with self._lock:
+            self._refill(time.time() if now is None else now)
+            return self.tokens
+
+    def try_consume(self, amount: float = 1.0, now: Optional[float] = None) -> bool:
+        """Förbrukar tokens om det finns tillräckligt många."""
+        with self._lock:
+            self._refill(time.time() if now is None else now)
+            if self.tokens < amount:
+                return False
+            self.tokens -= amount
+            return True
+
+    def wait_time(self, amount: float = 1.0, now: Optional[float] = None) -> float:
+        """Returnerar antal sekunder tills `amount` tokens finns tillgängliga."""
+        with self._lock:
+            self._refill(time.time() if now is None else now)
+            missing = amount - self.tokens
+            return 0.0 if missing <= 0 else missing / self.rate
+
+    def consume(self, amount: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """Väntar (högst `timeout` sekunder) tills tokens finns och förbrukar dem."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.try_consume(amount):
+                return True
+            delay = self.wait_time(amount)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                delay = min(delay, remaining)
+            time.sleep(max(delay, 0.01))
+
+    def to_dict(self) -> Dict:
+        return {"tokens": self.tokens, "updated": self.updated}
+
+
+class SearchRateLimiter:
+    """
+    Delad sökbudget per kalenderdygn och per minut.
+    Dygnstaket räknas med date/count och nollställs vid midnatt (lokal tid);
+    minutgränsen är en token bucket så att sökningar inte görs i skurar.
+    Läsning, påfyllning och förbrukning sker under ett fillås och sparas atomiskt.
+    """
+
+    def __init__(self, state_file: str, per_day: int = 50, per_minute: int = 3):
+        self.state_file = state_file
+        self.lock = FileLock(state_file + '.lock')
+        self.per_day = per_day
+        self.limits = {
+            'minute': (per_minute, 60.0),
+        }
+
+    def _load_buckets(self, state: Dict) -> Dict[str, TokenBucket]:
+        """Skapar hinkarna från sparat tillstånd (eller fulla hinkar)."""
+        saved = state.get('buckets') or {}
+        buckets = {}
+        for name, (capacity, period) in self.limits.items():
+            data = saved.get(name) or {}
+            buckets[name] = TokenBucket(capacity, period, data.get('tokens'), data.get('updated'))
+        return buckets
+
+    @staticmethod
+    def _count_today(state: Dict) -> int:
+        """Antal sökningar som gjorts under dagens datum."""
+        return int(state.get('count', 0)) if state.get('date') == time.strftime("%Y-%m-%d") else 0
+
+    @staticmethod
+    def _seconds_until_midnight() -> float:
+        now = datetime.datetime.now()
+        midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+        return max(0.0, (midnight - now).total_seconds())
+
+    def _save(self, state: Dict, buckets: Dict[str, TokenBucket]):
+        atomic_write_json(self.state_file, {
+            "date": state['date'],
+            "count": state['count'],
+            "buckets": {name: bucket.to_dict() for name, bucket in buckets.items()},
+        })
+
+    def acquire(self):
+        """
+        Förbrukar en sökning eller kastar RateLimitExceeded med väntetiden
+        tills nästa sökning får göras.
+        """
+        if not self.try_acquire():
+            raise RateLimitExceeded("Sökbudgeten är slut", self.wait_time())
+
+    def wait_time(self) -> float:
+        """Sekunder tills både dygns- och minutbudgeten har en sökning ledig."""
+        try:
+            with self.lock:
+                state = read_json(self.state_file, {})
+                if not isinstance(state, dict):
+                    state = {}
+                buckets = self._load_buckets(state)
+        except TimeoutError:
+            return 0.0
+        if self._count_today(state) >= self.per_day:
+            return self._seconds_until_midnight()
+        now = time.time()
+        return max(bucket.wait_time(1.0, now) for bucket in buckets.values())
+
+    def try_acquire(self) -> bool:
+        """
+        Förbrukar en sökning om både dygns- och minutbudgeten tillåter det.
+
+        Returns:
+            bool: True om sökningen får göras
+        """
+        try:
+            with self.lock:
+                state = read_json(self.state_file, {})
+                if not isinstance(state, dict):
+                    state = {}
+                buckets = self._load_buckets(state)
+                now = time.time()
+
+                count = self._count_today(state)
+                if count >= self.per_day:
+                    logger.warning("Daglig sökgräns uppnådd")
+                    return False
+
+                for bucket in buckets.values():
+                    if bucket.available(now) < 1.0:
+                        logger.warning(
+                            f"Sökgräns per minut uppnådd, nästa sökning om "
+                            f"{bucket.wait_time(1.0, now):.0f} s"
+                        )
+                        return False
+
+                for bucket in buckets.values():
+                    bucket.try_consume(1.0, now)
+
+                state['count'] = count + 1
+                state['date'] = time.strftime("%Y-%m-%d")
+                self._save(state, buckets)
+                logger.info(f"Sökningar kvar idag: {self.per_day - state['count']}")
+                return True
+        except TimeoutError as e:
+            logger.error(f"Kunde inte läsa sökräknaren: {e}")
+            return False
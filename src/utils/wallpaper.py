@@ -3,60 +3,220 @@ Modul för att hantera nedladdning av bilder och inställning av skrivbordsbakgr
 """
 
 import os
-import ctypes
+import time
+import hashlib
 import platform
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, Sequence
+
 import requests
 from PIL import Image
 from io import BytesIO
 
+from utils.paths import get_app_paths
+from utils.locking import read_json, atomic_write_json
+from utils.wallpaper_backends import get_backend
+
 logger = logging.getLogger(__name__)
 
-def download_image(url: str, save_path: str) -> bool:
+CHUNK_SIZE = 64 * 1024
+POLL_INTERVAL = 0.25  # Hur ofta nedladdningarnas takt kontrolleras
+
+class _Transfer:
+    """En pågående nedladdning som kan avbrytas och vars takt kan följas."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.received = 0
+        self.started = time.monotonic()
+        self.cancelled = threading.Event()
+
+    def rate(self) -> float:
+        """Genomsnittlig takt i byte/s sedan starten."""
+        return self.received / max(time.monotonic() - self.started, 1e-6)
+
+def _fetch(transfer: _Transfer, timeout: float, host_health=None, session=None) -> Optional[Image.Image]:
+    """
+    Hämtar bilden i delar och verifierar format och dimensioner.
+    Returnerar den öppnade bilden, eller None om hämtningen avbröts eller bilden underkändes.
+    """
+    url = transfer.url
+    try:
+        response = (session or requests).get(url, timeout=timeout, stream=True)
+        response.raise_for_status()
+        chunks = []
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if transfer.cancelled.is_set():
+                response.close()
+                return None
+            chunks.append(chunk)
+            transfer.received += len(chunk)
+    except requests.RequestException as e:
+        if host_health and not transfer.cancelled.is_set() and not getattr(e.response, 'from_cache', False):
+            host_health.record_request_error(url, e)
+        raise
+    if host_health and not getattr(response, 'from_cache', False):
+        host_health.record_success(url, response.elapsed.total_seconds())
+
+    # Öppna bilden med PIL för att verifiera format och dimensioner
+    img = Image.open(BytesIO(b''.join(chunks)))
+    width, height = img.size
+
+    # Verifiera att bilden är i landskapsformat och har tillräcklig upplösning
+    if width < height:
+        logger.error(f"Bilden är i porträttformat: {width}x{height}")
+        return None
+
+    if width < 1920 or height < 1080:
+        logger.error(f"Bilden har för låg upplösning: {width}x{height}")
+        return None
+
+    return img
+
+def _save_image(img: Image.Image, save_path: str):
+    """Sparar bilden; JPEG saknar alfakanal och palett, så sådana bilder konverteras till RGB."""
+    if save_path.lower().endswith(('.jpg', '.jpeg')) and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    img.save(save_path, quality=95)
+
+def download_image(url: str, save_path: str, host_health=None, session=None,
+                   alternates: Sequence[str] = (), deadline=None,
+                   hedge_after: float = 3.0, hedge_min_rate: float = 300 * 1024) -> Optional[str]:
     """
     Laddar ner en bild från en URL och sparar den lokalt.
     Verifierar också att bilden är i landskapsformat och har tillräcklig upplösning.
-    
+
+    Nedladdningen är "hedgad": om den valda bilden efter `hedge_after` sekunder
+    laddas ner långsammare än `hedge_min_rate`, eller misslyckas, startas nästa
+    bild i `alternates` parallellt. Den första godkända bilden som blir klar sparas
+    och övriga nedladdningar avbryts.
+
+    Via HTTP-cachen är en redan verifierad bild oftast en cacheträff som blir klar
+    direkt, och då startas ingen reservbild. Hedgingen skyddar de fall där bilden
+    måste hämtas igen: cachen är avstängd, svaret fick inte sparas (no-store eller
+    för stort) eller posten har blivit inaktuell och värden har blivit långsam.
+
     Args:
         url (str): URL:en till bilden som ska laddas ner
         save_path (str): Sökvägen där bilden ska sparas
-        
+        host_health (HostHealthTable): Valfri hälsotabell som väljer timeout och
+            registrerar utfallet för bildens värd
+        session (requests.Session): Valfri session, t.ex. via HTTP-cachen så att en
+            redan verifierad bild inte laddas ner igen
+        alternates (Sequence[str]): Reservbilder i rangordning
+        deadline (Deadline): Valfri tidsgräns för hela nedladdningen
+        hedge_after (float): Sekunder innan en trög nedladdning får sällskap
+        hedge_min_rate (float): Förväntad lägsta takt i byte/s
+
     Returns:
-        bool: True om nedladdningen lyckades, False annars
+        str: URL:en till bilden som faktiskt sparades (kan vara en reservbild),
+        eller None om nedladdningen misslyckades
     """
-    try:
-        # Skapa katalogen om den inte finns
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        
-        # Hämta bilden
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        
-        # Öppna bilden med PIL för att verifiera format och dimensioner
-        img = Image.open(BytesIO(response.content))
-        width, height = img.size
-        
-        # Verifiera att bilden är i landskapsformat och har tillräcklig upplösning
-        if width < height:
-            logger.error(f"Bilden är i porträttformat: {width}x{height}")
-            return False
-            
-        if width < 1920 or height < 1080:
-            logger.error(f"Bilden har för låg upplösning: {width}x{height}")
+    # Skapa katalogen om den inte finns
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+
+    candidates = [url] + [u for u in alternates if u != url]
+    transfers = {}
+    executor = ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix='download')
+
+    def start_next() -> bool:
+        if len(transfers) >= len(candidates):
             return False
-        
-        # Spara bilden
-        img.save(save_path, quality=95)
-        logger.info(f"Bild sparad: {save_path}")
+        next_url = candidates[len(transfers)]
+        if transfers:
+            logger.info(f"Startar parallell nedladdning av reservbild: {next_url}")
+        timeout = host_health.timeout_for(next_url, 10) if host_health else 10
+        if deadline is not None:
+            timeout = deadline.timeout(timeout)
+        transfer = _Transfer(next_url)
+        transfers[executor.submit(_fetch, transfer, timeout, host_health, session)] = transfer
         return True
-        
+
+    try:
+        start_next()
+        pending = set(transfers)
+        while pending:
+            if deadline is not None and deadline.expired:
+                logger.error("Tidsbudgeten tog slut under nedladdningen")
+                return None
+
+            done, pending = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                transfer = transfers[future]
+                try:
+                    img = future.result()
+                except Exception as e:
+                    logger.error(f"Fel vid nedladdning av bild {transfer.url}: {str(e)}")
+                    img = None
+                if img is None:
+                    continue
+
+                # Spara bilden; misslyckas det prövas nästa bild som vid en misslyckad hämtning
+                try:
+                    _save_image(img, save_path)
+                except Exception as e:
+                    logger.error(f"Kunde inte spara bild {transfer.url}: {str(e)}")
+                    continue
+                if transfer.url != url:
+                    logger.info(f"Reservbilden blev klar först: {transfer.url}")
+                logger.info(f"Bild sparad: {save_path}")
+                return transfer.url
+
+            # Misslyckade nedladdningar ersätts direkt; en trög nedladdning får
+            # sällskap av nästa bild när den halkat efter den förväntade takten
+            if done:
+                if start_next():
+                    pending = {f for f in transfers if not f.done()}
+                continue
+            active = [transfers[f] for f in pending]
+            newest = max(active, key=lambda t: t.started)
+            behind = (time.monotonic() - newest.started >= hedge_after
+                      and all(t.rate() < hedge_min_rate for t in active))
+            if behind and start_next():
+                pending = {f for f in transfers if not f.done()}
+
+        return None
+
     except Exception as e:
         logger.error(f"Fel vid nedladdning av bild: {str(e)}")
-        return False
+        return None
+    finally:
+        for transfer in transfers.values():
+            transfer.cancelled.set()
+        executor.shutdown(wait=False)
+        if host_health:
+            host_health.save()
+
+def _file_digest(path: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def _current_digest(backend, state: dict) -> Optional[str]:
+    """Innehållshash för nuvarande bakgrundsbild, om den går att ta reda på."""
+    try:
+        current = backend.current()
+    except Exception as e:
+        logger.warning(f"Kunde inte läsa nuvarande bakgrundsbild: {str(e)}")
+        current = None
+
+    if current is None:
+        # Backenden kan inte läsa av bilden; lita på vad vi själva ställde in senast
+        return state.get('sha1') if state.get('backend') == backend.name else None
+    if not os.path.exists(current):
+        return None
+    if state.get('path') == current and state.get('mtime') == os.path.getmtime(current):
+        return state.get('sha1')
+    return _file_digest(current)
 
 def set_wallpaper(image_path: str) -> bool:
     """
     Sätter den angivna bilden som skrivbordsbakgrund.
+    Gör inget om en bild med samma innehåll redan är inställd.
     
     Args:
         image_path (str): Sökvägen till bilden som ska användas
@@ -71,63 +231,37 @@ def set_wallpaper(image_path: str) -> bool:
         if not os.path.exists(abs_path):
             logger.error(f"Bilden kunde inte hittas: {abs_path}")
             return False
-            
-        # Hantera olika operativsystem
-        system = platform.system().lower()
-        
-        if system == "windows":
-            # Windows: Använd ctypes för att anropa SystemParametersInfo
-            SPI_SETDESKWALLPAPER = 0x0014
-            SPIF_UPDATEINIFILE = 0x01
-            SPIF_SENDCHANGE = 0x02
-            
-            if ctypes.windll.user32.SystemParametersInfoW(
-                SPI_SETDESKWALLPAPER, 0, abs_path, SPIF_UPDATEINIFILE | SPIF_SENDCHANGE
-            ):
-                logger.info("Bakgrundsbild inställd på Windows")
-                return True
-                
-        elif system == "darwin":  # macOS
-            try:
-                from appscript import app, mactypes
-                app('Finder').desktop_picture.set(mactypes.File(abs_path))
-                logger.info("Bakgrundsbild inställd på macOS")
-                return True
-            except ImportError:
-                logger.error("appscript krävs för att ändra bakgrundsbild på macOS")
-                return False
-                
-        elif system == "linux":
-            # Försök med olika skrivbordsmiljöer
-            desktop = os.environ.get('XDG_CURRENT_DESKTOP', '').lower()
-            
-            if 'gnome' in desktop or 'unity' in desktop:
-                os.system(f"gsettings set org.gnome.desktop.background picture-uri file://{abs_path}")
-                logger.info("Bakgrundsbild inställd på GNOME/Unity")
-                return True
-                
-            elif 'kde' in desktop:
-                os.system(
-                    f"dbus-send --session --dest=org.kde.plasmashell --type=method_call "
-                    f"/PlasmaShell org.kde.PlasmaShell.evaluateScript 'string:"
-                    f"var all = desktops();for (i=0;i<all.length;i++){{"
-                    f"d = all[i];d.wallpaperPlugin = \"org.kde.image\";"
-                    f"d.currentConfigGroup = Array(\"Wallpaper\", \"org.kde.image\", \"General\");"
-                    f"d.writeConfig(\"Image\", \"file://{abs_path}\")}}'"
-                )
-                logger.info("Bakgrundsbild inställd på KDE")
-                return True
-                
-            else:
-                logger.error(f"Skrivbordsmiljön stöds inte: {desktop}")
-                return False
-                
-        else:
-            logger.error(f"Operativsystemet stöds inte: {system}")
+
+        backend = get_backend()
+        if backend is None:
+            desktop = os.environ.get('XDG_CURRENT_DESKTOP', '')
+            logger.error(f"Operativsystemet/skrivbordsmiljön stöds inte: {platform.system()} {desktop}".strip())
             return False
-            
+
+        state_file = get_app_paths()['wallpaper_state_file']
+        state = read_json(state_file, {}) or {}
+        digest = _file_digest(abs_path)
+        if _current_digest(backend, state) == digest:
+            logger.info("Bilden är redan inställd som bakgrundsbild, inget att ändra")
+            return True
+
+        if not backend.apply(abs_path):
+            logger.error(f"Bakgrundsbilden ändrades inte ({backend.name})")
+            return False
+
+        try:
+            atomic_write_json(state_file, {
+                'backend': backend.name,
+                'path': abs_path,
+                'mtime': os.path.getmtime(abs_path),
+                'sha1': digest,
+            })
+        except Exception as e:
+            logger.warning(f"Kunde inte spara bakgrundsbildens status: {str(e)}")
+
+        logger.info(f"Bakgrundsbild inställd ({backend.name})")
+        return True
+
     except Exception as e:
         logger.error(f"Fel vid inställning av bakgrundsbild: {str(e)}")
         return False
-        
-    return False  # Om vi når hit har något gått fel
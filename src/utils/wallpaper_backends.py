@@ -0,0 +1,310 @@
+"""
+Plattformsberoende sätt att ställa in skrivbordsbakgrunden.
+Varje skrivbordsmiljö har en backend som ställer in bilden direkt via
+systemets API (ctypes, Gio.Settings eller D-Bus), läser tillbaka värdet (eller
+väntar på dconf:s bekräftelse) för att kontrollera att det gick igenom och kan
+berätta vilken bild som är inställd.
+Backenden väljs en gång per process via registret och återanvänds, så att
+t.ex. D-Bus-anslutningen hålls öppen.
+"""
+
+import os
+import json
+import ctypes
+import logging
+import platform
+from pathlib import Path
+from typing import Dict, List, Optional, Type
+from urllib.parse import unquote, urlparse
+
+logger = logging.getLogger(__name__)
+
+_BACKENDS: List[Type['WallpaperBackend']] = []
+_selected: Optional['WallpaperBackend'] = None
+_bus = None
+
+
+def register_backend(cls: Type['WallpaperBackend']) -> Type['WallpaperBackend']:
+    """Lägger till en backend i registret (prövas i registreringsordning)."""
+    _BACKENDS.append(cls)
+    return cls
+
+
+def get_backend() -> Optional['WallpaperBackend']:
+    """Returnerar den första backend som passar den här datorn, eller None."""
+    global _selected
+    if _selected is not None:
+        return _selected
+    for cls in _BACKENDS:
+        try:
+            if cls.matches():
+                _selected = cls()
+                logger.info(f"Använder bakgrundsbild-backend: {cls.name}")
+                return _selected
+        except Exception as e:
+            logger.warning(f"Backend {cls.name} kunde inte startas: {str(e)}")
+    return None
+
+
+def _path_from_uri(value: str) -> str:
+    """Gör om 'file:///a%20b.jpg' (eller en vanlig sökväg) till en sökväg."""
+    if value.startswith('file://'):
+        return unquote(urlparse(value).path)
+    return value
+
+
+def _desktop() -> str:
+    return os.environ.get('XDG_CURRENT_DESKTOP', '').lower()
+
+
+class WallpaperBackend:
+    """Basklass för en skrivbordsmiljö."""
+
+    name = ''
+
+    @classmethod
+    def matches(cls) -> bool:
+        """True om backenden hör till den här datorns system/skrivbordsmiljö."""
+        raise NotImplementedError
+
+    def current(self) -> Optional[str]:
+        """Sökvägen till nuvarande bakgrundsbild, eller None om den inte går att läsa."""
+        return None
+
+    def apply(self, abs_path: str) -> bool:
+        """Ställer in bilden och returnerar True om det gick igenom."""
+        raise NotImplementedError
+
+
+@register_backend
+class WindowsBackend(WallpaperBackend):
+    name = 'windows'
+
+    SPI_GETDESKWALLPAPER = 0x0073
+    SPI_SETDESKWALLPAPER = 0x0014
+    SPIF_UPDATEINIFILE = 0x01
+    SPIF_SENDCHANGE = 0x02
+
+    @classmethod
+    def matches(cls) -> bool:
+        return platform.system().lower() == 'windows'
+
+    def current(self) -> Optional[str]:
+        buffer = ctypes.create_unicode_buffer(1024)
+        if ctypes.windll.user32.SystemParametersInfoW(self.SPI_GETDESKWALLPAPER, len(buffer), buffer, 0):
+            return buffer.value or None
+        return None
+
+    def apply(self, abs_path: str) -> bool:
+        # Windows: Använd ctypes för att anropa SystemParametersInfo
+        # Returvärdet räcker som kontroll: äldre Windows rapporterar en omkodad
+        # kopia (TranscodedWallpaper) i stället för den angivna sökvägen
+        return bool(ctypes.windll.user32.SystemParametersInfoW(
+            self.SPI_SETDESKWALLPAPER, 0, abs_path, self.SPIF_UPDATEINIFILE | self.SPIF_SENDCHANGE
+        ))
+
+
+@register_backend
+class MacBackend(WallpaperBackend):
+    name = 'macos'
+
+    @classmethod
+    def matches(cls) -> bool:
+        return platform.system().lower() == 'darwin'
+
+    def __init__(self):
+        try:
+            from appscript import app, mactypes
+        except ImportError:
+            raise RuntimeError("appscript krävs för att ändra bakgrundsbild på macOS")
+        self._finder = app('Finder')
+        self._mactypes = mactypes
+
+    def apply(self, abs_path: str) -> bool:
+        self._finder.desktop_picture.set(self._mactypes.File(abs_path))
+        return True
+
+
+def _session_bus():
+    """Den gemensamma D-Bus-anslutningen (jeepney) som GNOME- och KDE-backenden delar."""
+    global _bus
+    if _bus is None:
+        try:
+            from jeepney.io.blocking import open_dbus_connection
+        except ImportError:
+            raise RuntimeError("jeepney krävs för att ändra bakgrundsbild via D-Bus")
+        _bus = open_dbus_connection(bus='SESSION')
+    return _bus
+
+
+def _offset_size(body_length: int, count: int) -> int:
+    """Bredden på GVariant-ramoffset: minsta storlek där hela behållaren ryms."""
+    for size in (1, 2, 4, 8):
+        if body_length + count * size < 1 << (8 * size):
+            return size
+    raise ValueError("För stor GVariant")
+
+
+def _dconf_changeset(values: Dict[str, str]) -> bytes:
+    """
+    Serialiserar en dconf-ändring av strängvärden som GVariant a{smv}
+    (little endian), det format ca.desrt.dconf.Writer.Change tar emot.
+    """
+    array = b''
+    ends = []
+    for key, value in values.items():
+        key_bytes = key.encode('utf-8') + b'\0'
+        # Medlemmen mv justeras till 8 byte; variant = värde, nollbyte, typsträng; maybe Just = + nollbyte
+        body = key_bytes + b'\0' * (-len(key_bytes) % 8) + value.encode('utf-8') + b'\0' + b'\0s' + b'\0'
+        entry = body + len(key_bytes).to_bytes(_offset_size(len(body), 1), 'little')
+        array += b'\0' * (-len(array) % 8) + entry
+        ends.append(len(array))
+    size = _offset_size(len(array), len(ends))
+    return array + b''.join(end.to_bytes(size, 'little') for end in ends)
+
+
+class _DconfWriter:
+    """Skriver dconf-nycklar via ca.desrt.dconf.Writer över sessionsbussen."""
+
+    def __init__(self, timeout: float = 5.0):
+        from jeepney import DBusAddress, MatchRule, message_bus, new_method_call
+        from jeepney.wrappers import unwrap_msg
+        self._connection = _session_bus()
+        self._new_method_call = new_method_call
+        self._unwrap = unwrap_msg
+        self._address = DBusAddress('/ca/desrt/dconf/Writer/user', bus_name='ca.desrt.dconf',
+                                    interface='ca.desrt.dconf.Writer')
+        self._notify = MatchRule(type='signal', interface='ca.desrt.dconf.Writer',
+                                 member='Notify', path='/ca/desrt/dconf/Writer/user')
+        self._unwrap(self._connection.send_and_get_reply(message_bus.AddMatch(self._notify), timeout=timeout))
+        self.timeout = timeout
+
+    def write(self, values: Dict[str, str]) -> bool:
+        """
+        Skriver alla värden i en ändring och väntar på dconf-tjänstens Notify
+        med samma tagg, som skickas först när ändringen är sparad.
+        """
+        message = self._new_method_call(self._address, 'Change', 'ay', (_dconf_changeset(values),))
+        with self._connection.filter(self._notify) as queue:
+            tag = self._unwrap(self._connection.send_and_get_reply(message, timeout=self.timeout))[0]
+            while True:
+                prefix, changes, notified_tag = self._connection.recv_until_filtered(
+                    queue, timeout=self.timeout).body
+                if notified_tag == tag:
+                    written = {prefix + change for change in changes} if changes else {prefix}
+                    return set(values) <= written
+
+
+@register_backend
+class GnomeBackend(WallpaperBackend):
+    """
+    GNOME och skrivbord som använder samma GSettings-schema (Unity, Budgie m.fl.).
+    Med PyGObject används Gio.Settings; annars skrivs nycklarna direkt till
+    dconf över D-Bus (jeepney). dconf kan inte läsas via D-Bus, så då avgör
+    set_wallpaper vad som är inställt utifrån sitt eget sparade tillstånd.
+    """
+
+    name = 'gnome'
+    DESKTOPS = ('gnome', 'unity', 'budgie', 'pantheon')
+    SCHEMA = 'org.gnome.desktop.background'
+    DCONF_DIR = '/org/gnome/desktop/background/'
+    KEYS = ('picture-uri', 'picture-uri-dark')  # picture-uri-dark finns från GNOME 42
+
+    @classmethod
+    def matches(cls) -> bool:
+        return platform.system().lower() == 'linux' and any(d in _desktop() for d in cls.DESKTOPS)
+
+    def __init__(self):
+        try:
+            import gi
+            gi.require_version('Gio', '2.0')
+            from gi.repository import Gio
+        except (ImportError, ValueError):
+            self._settings = None
+            self._dconf = _DconfWriter()
+            logger.info("PyGObject saknas, skriver till dconf via D-Bus")
+            return
+        self._gio = Gio
+        self._settings = Gio.Settings.new(self.SCHEMA)
+        schema = self._settings.get_property('settings-schema')
+        self._keys = [key for key in self.KEYS if schema.has_key(key)]
+
+    def current(self) -> Optional[str]:
+        if self._settings is None:
+            return None
+        value = self._settings.get_string(self.KEYS[0])
+        return _path_from_uri(value) if value else None
+
+    def apply(self, abs_path: str) -> bool:
+        uri = Path(abs_path).as_uri()
+        if self._settings is None:
+            # Nycklar som saknas i äldre scheman ignoreras av GNOME, så båda skrivs alltid
+            return self._dconf.write({self.DCONF_DIR + key: uri for key in self.KEYS})
+        for key in self._keys:
+            self._settings.set_string(key, uri)
+        # Skriv till dconf innan värdet läses tillbaka
+        self._gio.Settings.sync()
+        return all(self._settings.get_string(key) == uri for key in self._keys)
+
+
+@register_backend
+class KdeBackend(WallpaperBackend):
+    """KDE Plasma via PlasmaShell.evaluateScript över en beständig D-Bus-anslutning."""
+
+    name = 'kde'
+
+    SET_SCRIPT = """
+var image = %s;
+var all = desktops();
+for (var i = 0; i < all.length; i++) {
+    var d = all[i];
+    d.wallpaperPlugin = "org.kde.image";
+    d.currentConfigGroup = Array("Wallpaper", "org.kde.image", "General");
+    d.writeConfig("Image", image);
+}
+"""
+    GET_SCRIPT = """
+var all = desktops();
+var images = [];
+for (var i = 0; i < all.length; i++) {
+    all[i].currentConfigGroup = Array("Wallpaper", "org.kde.image", "General");
+    images.push(all[i].readConfig("Image"));
+}
+print(images.join("\\n"));
+"""
+
+    @classmethod
+    def matches(cls) -> bool:
+        return platform.system().lower() == 'linux' and 'kde' in _desktop()
+
+    def __init__(self, timeout: float = 5.0):
+        try:
+            from jeepney import DBusAddress, new_method_call
+            from jeepney.wrappers import unwrap_msg
+        except ImportError:
+            raise RuntimeError("jeepney krävs för att ändra bakgrundsbild på KDE")
+        self._new_method_call = new_method_call
+        self._unwrap = unwrap_msg
+        self._address = DBusAddress('/PlasmaShell', bus_name='org.kde.plasmashell',
+                                    interface='org.kde.PlasmaShell')
+        self._connection = _session_bus()
+        self.timeout = timeout
+
+    def _evaluate(self, script: str) -> str:
+        message = self._new_method_call(self._address, 'evaluateScript', 's', (script,))
+        reply = self._connection.send_and_get_reply(message, timeout=self.timeout)
+        body = self._unwrap(reply)
+        return body[0] if body else ''
+
+    def _images(self) -> List[str]:
+        return [_path_from_uri(line) for line in self._evaluate(self.GET_SCRIPT).splitlines() if line]
+
+    def current(self) -> Optional[str]:
+        images = self._images()
+        return images[0] if images else None
+
+    def apply(self, abs_path: str) -> bool:
+        # Sökvägen skickas som JSON-sträng, så tecken som ' och " i namnet är ofarliga
+        self._evaluate(self.SET_SCRIPT % json.dumps(Path(abs_path).as_uri()))
+        images = self._images()
+        return bool(images) and all(image == abs_path for image in images)
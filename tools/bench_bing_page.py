@@ -0,0 +1,106 @@
+"""
+Mäter sidladdning och utläsning av bilddata i Edge mot en lokal ersättningssida
+för Bings resultatsida, med och utan resursblockering/eager-laddning.
+
+Kräver Edge och msedgedriver. Körs från projektroten:
+    python tools/bench_bing_page.py [antal_körningar]
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from api.bing_scraper import BingScraper, get_edge_driver_service
+
+NUM_RESULTS = 35
+RESOURCE_DELAY = 0.15  # Simulerad svarstid för miniatyrer, typsnitt och media
+
+
+def build_page() -> str:
+    items = []
+    for i in range(NUM_RESULTS):
+        m = json.dumps({"murl": f"https://example.com/wallpaper_{i}.jpg", "turl": f"/th?id={i}", "t": f"Bild {i}"})
+        items.append(
+            f'<a class="iusc" m=\'{m}\'><img src="/th?id={i}" width="300" height="200"></a>'
+            f'<video src="/media/{i}.mp4" preload="auto"></video>'
+        )
+    return (
+        "<html><head><style>@font-face{font-family:x;src:url(/font.woff2)} body{font-family:x}</style>"
+        "</head><body>" + "".join(items) + "</body></html>"
+    )
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    page = build_page().encode('utf-8')
+
+    def do_GET(self):
+        if self.path.startswith('/images/search'):
+            body, content_type = self.page, 'text/html; charset=utf-8'
+        else:
+            time.sleep(RESOURCE_DELAY)
+            body, content_type = b'\0' * 20000, 'application/octet-stream'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run_once(scraper: BingScraper, url: str, diet: bool) -> tuple:
+    options = scraper._build_edge_options(scraper.headless_mode)
+    if not diet:
+        options.page_load_strategy = 'normal'
+        options.experimental_options.pop('prefs', None)
+    driver = webdriver.Edge(service=get_edge_driver_service(), options=options)
+    try:
+        if diet:
+            scraper._block_heavy_resources(driver)
+        started = time.perf_counter()
+        driver.get(url)
+        WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.CLASS_NAME, "iusc")))
+        load_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        if diet:
+            payloads = scraper._extract_payloads(driver, 12)
+        else:
+            payloads = [e.get_attribute('m') for e in driver.find_elements(By.CLASS_NAME, "iusc")[:12]]
+        extract_time = time.perf_counter() - started
+        assert len(payloads) == 12
+        return load_time, extract_time
+    finally:
+        driver.quit()
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/images/search?q=test"
+
+    scraper = BingScraper()
+    for label, diet in (("Före (normal laddning, get_attribute per element)", False),
+                        ("Efter (eager, CDP-blockering, ett execute_script)", True)):
+        results = [run_once(scraper, url, diet) for _ in range(runs)]
+        load = sorted(r[0] for r in results)[len(results) // 2]
+        extract = sorted(r[1] for r in results)[len(results) // 2]
+        print(f"{label}: sidladdning {load:.3f} s, utläsning {extract * 1000:.1f} ms (median av {runs})")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
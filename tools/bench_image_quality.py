@@ -0,0 +1,78 @@
+"""
+Mikrobenchmark för kvalitetsbedömningen av bildkandidater.
+Skapar syntetiska 1920x1080-testbilder (skarp, suddig, grå, hårt komprimerad)
+och mäter avkodning per kandidat samt den vektoriserade batchbedömningen.
+
+Körs från projektroten:
+    python tools/bench_image_quality.py [antal_kandidater]
+"""
+
+import os
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from utils.image_quality import ImageQualityScorer, compute_features, decode_sample
+
+
+def make_fixtures() -> dict:
+    """Skapar testbilder som JPEG-bytes."""
+    rng = np.random.default_rng(42)
+    width, height = 1920, 1080
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None, None]
+    gradient = np.concatenate([np.broadcast_to(x, (height, width, 1)),
+                               np.broadcast_to(y, (height, width, 1)),
+                               np.broadcast_to(1 - x, (height, width, 1))], axis=2)
+    detail = rng.integers(0, 2, size=(height // 8, width // 8, 1)).repeat(8, 0).repeat(8, 1)
+    sharp = Image.fromarray(np.clip(gradient * 200 + detail * 55, 0, 255).astype(np.uint8))
+
+    def encode(img, quality):
+        buf = BytesIO()
+        img.save(buf, format='JPEG', quality=quality)
+        return buf.getvalue()
+
+    return {
+        'skarp': encode(sharp, 92),
+        'suddig': encode(sharp.filter(ImageFilter.GaussianBlur(6)), 92),
+        'grå': encode(sharp.convert('L').convert('RGB'), 92),
+        'komprimerad': encode(sharp, 8),
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    fixtures = make_fixtures()
+    names = list(fixtures)
+    candidates = [names[i % len(names)] for i in range(count)]
+
+    scorer = ImageQualityScorer(randomness=0.0)
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    for name in candidates:
+        scorer.add(fixtures[name])
+    decode_wall = time.perf_counter() - started
+    decode_cpu = time.process_time() - cpu_started
+
+    samples = [decode_sample(fixtures[name]) for name in candidates]
+    started = time.perf_counter()
+    features = compute_features(samples)
+    batch_time = time.perf_counter() - started
+
+    scores = scorer.scores()
+    print(f"{count} kandidater: avkodning {decode_wall / count * 1000:.1f} ms/st "
+          f"(CPU {decode_cpu / count * 1000:.1f} ms/st, budget {scorer.cpu_budget * 1000:.0f} ms), "
+          f"batchbedömning {batch_time * 1000:.1f} ms totalt")
+    for name in names:
+        i = candidates.index(name)
+        measures = ", ".join(f"{key} {values[i]:.2f}" for key, values in features.items())
+        print(f"  {name:12s} betyg {scores[i]:.3f} ({measures})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Kontrollerar LAN-noden och klienten på localhost, utan webbläsare eller internet:
+- Listan förnyas med If-None-Match; oförändrad lista ger 304 och läses ur cachen
+- En bild som redan hämtats en gång tas ur HTTP-cachen utan att noden frågas
+- Har noden inga nya bilder återanvänds en av dess bilder (helst en cachad)
+  i stället för att klienten söker själv
+- När noden stängts faller klienten tillbaka till de egna bildkällorna
+
+Alla filer (settings.ini, historik, cache) skapas i en tillfällig mapp.
+Körs från projektroten:
+    python tools/check_lan_node.py
+"""
+
+import os
+import sys
+import shutil
+import socket
+import logging
+import tempfile
+import threading
+import time
+import traceback
+from io import BytesIO
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+TEMP_DIR = tempfile.mkdtemp(prefix='search_wallpaper_lan_check_')
+
+import utils.paths
+# Programmets filer hamnar i den tillfälliga mappen i stället för bredvid källkoden
+utils.paths.get_executable_dir = lambda: TEMP_DIR
+
+from api.image_search import ImageSearch
+from api.lan_node import LanNode
+from api.lan_provider import LanNodeProvider
+from utils.http_cache import HttpCache, create_cached_session
+
+NUM_IMAGES = 3
+
+SETTINGS = """
+[Deadline]
+total_seconds = 30
+backoff_base_seconds = 0.1
+backoff_max_seconds = 0.2
+
+[Providers]
+enabled = wikimedia
+wikimedia_api_url = http://127.0.0.1:{dead_port}/w/api.php
+wanted_images = 1
+timeout_seconds = 5
+
+[LanNode]
+url = http://127.0.0.1:{port}/
+timeout_seconds = 2
+"""
+
+
+class NodeRequests(logging.Handler):
+    """Samlar nodens åtkomstlogg ("GET /wallpapers HTTP/1.1" 304 -) för att räkna förfrågningar."""
+
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(record.getMessage())
+
+    def count(self, path: str, status: int) -> int:
+        return sum(1 for line in self.lines if f'"GET {path} ' in line and f'" {status} ' in line)
+
+
+def make_image(seed: int) -> bytes:
+    buf = BytesIO()
+    img = Image.linear_gradient('L').rotate(seed * 90).resize((1920, 1080)).convert('RGB')
+    img.save(buf, format='JPEG', quality=90)
+    return buf.getvalue()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def check_list_revalidation(node: LanNode, requests_log: NodeRequests, session):
+    provider = LanNodeProvider(f"http://127.0.0.1:{node.address[1]}/", session=session)
+    first = list(provider.search('mountain', limit=10))
+    second = list(provider.search('mountain', limit=10))
+
+    assert len(first) == NUM_IMAGES and {c.url for c in first} == {c.url for c in second}, (first, second)
+    assert requests_log.count('/wallpapers', 200) == 1, requests_log.lines
+    assert requests_log.count('/wallpapers', 304) == 1, requests_log.lines
+    assert all(c.width == 1920 and c.file_type == 'jpeg' for c in first), first
+
+
+def check_image_from_cache(node: LanNode, requests_log: NodeRequests, session):
+    provider = LanNodeProvider(f"http://127.0.0.1:{node.address[1]}/", session=session)
+    url = next(iter(provider.search('mountain', limit=1))).url
+    path = url[url.index('/wallpapers/'):]
+
+    first = session.get(url, timeout=5)
+    assert first.status_code == 200 and not getattr(first, 'from_cache', False)
+    second = session.get(url, timeout=5)
+    assert second.content == first.content and second.from_cache, "bilden lästes inte ur cachen"
+    # Bilden är oföränderlig (immutable), så noden ska bara ha fått den första förfrågan
+    assert requests_log.count(path, 200) == 1 and requests_log.count(path, 304) == 0, requests_log.lines
+    return url
+
+
+def check_reuse_without_new_images(node: LanNode, cached_url: str):
+    search = ImageSearch()
+    assert search.using_lan_node
+    # Klienten har redan visat alla nodens bilder, den cachade senast; den väljs
+    # ändå eftersom den inte behöver överföras igen
+    urls = [c.url for c in search.providers[0].search('mountain', limit=10)]
+    search.history = [url for url in urls if url != cached_url] + [cached_url]
+
+    result = search.get_random_image()
+    assert result is not None, search.coordinator.errors
+    assert result[0] == cached_url, result
+    assert search.using_lan_node, "klienten föll tillbaka till att söka själv"
+    assert set(result[1]['alternates']) == set(urls) - {cached_url}, result
+
+
+def check_fallback_after_shutdown(node: LanNode):
+    node.shutdown()
+    search = ImageSearch()
+    assert search.using_lan_node
+
+    started = time.perf_counter()
+    assert search.get_random_image() is None
+    assert not search.using_lan_node, "klienten bytte inte till de egna källorna"
+    assert [p.name for p in search.providers] == ['wikimedia'], search.providers
+    # Den egna källan frågades (och misslyckades mot en stängd port) efter bytet
+    assert 'wikimedia' in search.coordinator.errors, search.coordinator.errors
+    assert time.perf_counter() - started < 10.0
+
+
+def main():
+    port, dead_port = free_port(), free_port()
+    with open(os.path.join(TEMP_DIR, 'settings.ini'), 'w', encoding='utf-8') as f:
+        f.write(SETTINGS.format(port=port, dead_port=dead_port))
+
+    requests_log = NodeRequests()
+    node_logger = logging.getLogger('api.lan_node')
+    node_logger.setLevel(logging.DEBUG)
+    node_logger.addHandler(requests_log)
+
+    node = LanNode(host='127.0.0.1', port=port, refresh_minutes=0)
+    for i in range(NUM_IMAGES):
+        with open(os.path.join(node.paths['cache_dir'], f"lan_wallpaper_{i}.jpg"), 'wb') as f:
+            f.write(make_image(i))
+    threading.Thread(target=node.serve_forever, daemon=True).start()
+
+    # Samma HTTP-cache som ImageSearch använder, så att en hämtad bild räknas som cachad
+    session = create_cached_session(HttpCache(node.paths['http_cache_dir']))
+    shared = {}
+    checks = [
+        ('check_list_revalidation', lambda: check_list_revalidation(node, requests_log, session)),
+        ('check_image_from_cache',
+         lambda: shared.update(cached_url=check_image_from_cache(node, requests_log, session))),
+        ('check_reuse_without_new_images', lambda: check_reuse_without_new_images(node, shared['cached_url'])),
+        ('check_fallback_after_shutdown', lambda: check_fallback_after_shutdown(node)),
+    ]
+    failed = 0
+    try:
+        for name, check in checks:
+            started = time.perf_counter()
+            try:
+                check()
+                print(f"OK    {name} ({time.perf_counter() - started:.2f} s)")
+            except Exception:
+                failed += 1
+                print(f"FEL   {name}")
+                traceback.print_exc()
+    finally:
+        node.shutdown()
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    print(f"{len(checks) - failed}/{len(checks)} kontroller godkända")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
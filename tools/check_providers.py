@@ -0,0 +1,243 @@
+"""
+Kontrollerar bildkällorna och koordinatorn mot lokala ersättningsservrar,
+utan nätverk, webbläsare eller riktiga API:er:
+- Wikimedia-källan tolkar ett MediaWiki-svar från en lokal JSON-server
+- En källa som hänger avbryts av koordinatorns tidsgräns (close() anropas)
+- Faller en källa bort levereras bilden från en annan; misslyckas en källa
+  och ingen bild godkänns görs nya försök, och sedan används en bild från cachen
+
+Alla filer (settings.ini, historik, cache) skapas i en tillfällig mapp.
+Körs från projektroten:
+    python tools/check_providers.py
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import traceback
+from io import BytesIO
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+TEMP_DIR = tempfile.mkdtemp(prefix='search_wallpaper_check_')
+
+import utils.paths
+# Programmets filer hamnar i den tillfälliga mappen i stället för bredvid källkoden
+utils.paths.get_executable_dir = lambda: TEMP_DIR
+
+from api.coordinator import ProviderCoordinator
+from api.image_search import ImageSearch
+from api.provider import ImageProvider
+from api.wikimedia import WikimediaProvider
+
+SETTINGS = """
+[Deadline]
+total_seconds = 30
+backoff_base_seconds = 0.1
+backoff_max_seconds = 0.2
+
+[Providers]
+wanted_images = 2
+timeout_seconds = 5
+
+[HttpCache]
+enabled = no
+"""
+
+
+def make_image(width: int, height: int) -> bytes:
+    buf = BytesIO()
+    img = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    img.save(buf, format='JPEG', quality=90)
+    return buf.getvalue()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Ersätter MediaWiki-API:t (/w/api.php) och bildvärden (/img/<n>.jpg).
+    Under /small/ anger API:t 1920x1080 men bilderna är för små och underkänns.
+    """
+
+    image = make_image(1920, 1080)
+    small_image = make_image(800, 600)
+    requests_seen = []
+
+    def _pages(self, prefix: str = '') -> dict:
+        base = f"http://127.0.0.1:{self.server.server_address[1]}{prefix}"
+        pages = {}
+        # Sidorna kommer i fel ordning i dict:en; 'index' anger sökordningen
+        for index in (3, 1, 2):
+            pages[str(100 + index)] = {
+                'index': index,
+                'title': f"File:Bild {index}.jpg",
+                'imageinfo': [{
+                    'url': f"{base}/img/{index}.jpg",
+                    'thumburl': f"{base}/thumb/{index}.jpg",
+                    'descriptionurl': f"{base}/wiki/File:Bild_{index}.jpg",
+                    'width': 1920, 'height': 1080, 'mime': 'image/jpeg',
+                }],
+            }
+        # Sida utan bildinformation (t.ex. raderad fil) ska hoppas över
+        pages['999'] = {'index': 4, 'title': 'File:Saknas.jpg', 'missing': ''}
+        return pages
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        StandInHandler.requests_seen.append((url.path, parse_qs(url.query), self.headers.get('User-Agent')))
+        prefix = '/small' if url.path.startswith('/small/') else ''
+        path = url.path[len(prefix):]
+        if path == '/w/api.php':
+            body = json.dumps({'query': {'pages': self._pages(prefix)}}).encode('utf-8')
+            content_type = 'application/json'
+        elif path.startswith('/img/'):
+            body, content_type = (self.small_image if prefix else self.image), 'image/jpeg'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HangingProvider(ImageProvider):
+    """Källa som fastnar (som en webbläsare som inte svarar) tills close() anropas."""
+
+    name = 'hanging'
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def search(self, query, limit=12, stop_event=None):
+        # Bryr sig inte om stop_event; bara close() får den att släppa
+        self.closed.wait(60)
+        return
+        yield
+
+    def close(self):
+        self.closed.set()
+
+
+class BrokenProvider(ImageProvider):
+    """Källa som alltid misslyckas, t.ex. blockerad av en captcha."""
+
+    name = 'broken'
+
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, query, limit=12, stop_event=None):
+        self.calls += 1
+        raise ConnectionError("blockerad")
+        yield
+
+
+def check_wikimedia_parsing(api_url: str):
+    StandInHandler.requests_seen.clear()
+    candidates = list(WikimediaProvider(api_url).search('beautiful mountain wallpaper', limit=5))
+
+    assert [c.title for c in candidates] == ['File:Bild 1.jpg', 'File:Bild 2.jpg', 'File:Bild 3.jpg'], \
+        [c.title for c in candidates]
+    first = candidates[0]
+    assert first.url.endswith('/img/1.jpg') and first.thumbnail_url.endswith('/thumb/1.jpg')
+    assert (first.width, first.height, first.file_type) == (1920, 1080, 'jpeg'), \
+        (first.width, first.height, first.file_type)
+    assert first.source == 'Wikimedia Commons' and first.query == 'beautiful mountain wallpaper'
+
+    path, params, user_agent = StandInHandler.requests_seen[0]
+    assert params['gsrsearch'] == ['mountain filetype:bitmap'], params['gsrsearch']
+    assert params['gsrlimit'] == ['5'] and user_agent == WikimediaProvider.USER_AGENT
+
+
+def check_hanging_provider_timeout(api_url: str):
+    hanging = HangingProvider()
+    coordinator = ProviderCoordinator([hanging, WikimediaProvider(api_url)], timeout=1.0)
+
+    started = time.perf_counter()
+    arrivals = []
+    for candidate in coordinator.candidates('mountain'):
+        arrivals.append(time.perf_counter() - started)
+    elapsed = time.perf_counter() - started
+
+    assert len(arrivals) == 3 and arrivals[-1] < 0.5, arrivals
+    assert 0.9 < elapsed < 2.0, elapsed
+    assert hanging.closed.is_set(), "close() anropades inte"
+    assert isinstance(coordinator.errors.get('hanging'), TimeoutError), coordinator.errors
+
+
+def check_fallback(api_url: str):
+    # En trasig källa ska inte hindra att bilden kommer från den andra
+    broken = BrokenProvider()
+    search = ImageSearch(providers=[broken, WikimediaProvider(api_url)])
+    result = search.get_random_image()
+    assert result is not None, search.coordinator.errors
+    image_url, meta = result
+    assert '/img/' in image_url and meta['source'] == 'Wikimedia Commons', result
+    assert meta['alternates'], meta
+    assert isinstance(search.coordinator.errors.get('broken'), ConnectionError), search.coordinator.errors
+
+    # Svarar en källa men ingen bild godkänns medan en annan källa misslyckas
+    # (t.ex. en tillfälligt trasig webbläsare) görs också nya försök
+    broken = BrokenProvider()
+    search = ImageSearch(providers=[broken, WikimediaProvider(api_url.replace('/w/', '/small/w/'))])
+    assert search.get_random_image() is None
+    assert broken.calls == 3, broken.calls
+    assert search.stats['fetched'] > 0, search.stats
+
+    # Misslyckas alla källor görs nya försök, och sedan finns cachen kvar som reserv
+    broken = BrokenProvider()
+    search = ImageSearch(providers=[broken])
+    started = time.perf_counter()
+    assert search.get_random_image() is None
+    assert broken.calls == 3, broken.calls
+    assert time.perf_counter() - started < 5.0
+
+    cached = os.path.join(search.paths['cache_dir'], 'wallpaper_cached.jpg')
+    with open(cached, 'wb') as f:
+        f.write(StandInHandler.image)
+    assert search.get_cached_image() == cached
+
+
+def main():
+    with open(os.path.join(TEMP_DIR, 'settings.ini'), 'w', encoding='utf-8') as f:
+        f.write(SETTINGS)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{server.server_address[1]}/w/api.php"
+
+    checks = [check_wikimedia_parsing, check_hanging_provider_timeout, check_fallback]
+    failed = 0
+    try:
+        for check in checks:
+            started = time.perf_counter()
+            try:
+                check(api_url)
+                print(f"OK    {check.__name__} ({time.perf_counter() - started:.2f} s)")
+            except Exception:
+                failed += 1
+                print(f"FEL   {check.__name__}")
+                traceback.print_exc()
+    finally:
+        server.shutdown()
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    print(f"{len(checks) - failed}/{len(checks)} kontroller godkända")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
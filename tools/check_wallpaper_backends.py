@@ -0,0 +1,179 @@
+"""
+Kontrollerar D-Bus-backenderna för GNOME (dconf) och KDE (PlasmaShell) mot
+ersättningstjänster på en privat sessionsbuss, så att den riktiga
+skrivbordsbakgrunden aldrig ändras:
+- _dconf_changeset ger exakt samma GVariant-bytes (a{smv}) som GLib
+- GnomeBackend skickar en ändring med picture-uri och picture-uri-dark till
+  ca.desrt.dconf.Writer och väntar på Notify med rätt tagg
+- KdeBackend ställer in bilden via evaluateScript och läser tillbaka den
+
+Kräver jeepney och dbus-run-session (dbus-daemon). Scriptet startar sig självt
+under dbus-run-session. Körs från projektroten:
+    python tools/check_wallpaper_backends.py
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import threading
+import time
+import traceback
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+PRIVATE_BUS_FLAG = 'SEARCH_WALLPAPER_PRIVATE_BUS'
+
+DCONF_DIR = '/org/gnome/desktop/background/'
+GNOME_IMAGE = '/tmp/search wallpaper/bild.jpg'
+
+# Referensbytes från GLib: g_variant_parse(a{smv}, ...) följt av g_variant_get_data
+GLIB_SINGLE = bytes.fromhex('2f612f62000000007800007300050e')  # {'/a/b': <'x'>}
+GLIB_GNOME = bytes.fromhex(  # picture-uri och picture-uri-dark = file:///tmp/search%20wallpaper/bild.jpg
+    '2f6f72672f676e6f6d652f6465736b746f702f6261636b67726f756e642f706963747572652d75726900000000000000'
+    '66696c653a2f2f2f746d702f73656172636825323077616c6c70617065722f62696c642e6a7067000073002a00000000'
+    '2f6f72672f676e6f6d652f6465736b746f702f6261636b67726f756e642f706963747572652d7572692d6461726b0000'
+    '66696c653a2f2f2f746d702f73656172636825323077616c6c70617065722f62696c642e6a7067000073002f5cbc'
+)
+# {picture-uri: file:///tmp/aaa…(300 st)….jpg, '/k': ''} är 393 byte och kräver 2-bytes offset
+GLIB_WIDE_SHA256 = '5d06618a785bb2419d2a685619e57e98923dae2555911bae8789bd0712040f77'
+
+
+def _serve(bus_name: str, handle_call):
+    """Kör en ersättningstjänst i en egen tråd med en egen anslutning till bussen."""
+    from jeepney import MessageType, new_error, new_method_return
+    from jeepney.bus_messages import message_bus
+    from jeepney.io.blocking import open_dbus_connection
+
+    connection = open_dbus_connection(bus='SESSION')
+    connection.send_and_get_reply(message_bus.RequestName(bus_name))
+
+    def loop():
+        while True:
+            message = connection.receive()
+            if message.header.message_type != MessageType.method_call:
+                continue
+            try:
+                signature, body = handle_call(connection, message)
+                connection.send(new_method_return(message, signature, body))
+            except Exception as e:
+                connection.send(new_error(message, 'org.freedesktop.DBus.Error.Failed', 's', (str(e),)))
+
+    threading.Thread(target=loop, name=f"stand-in-{bus_name}", daemon=True).start()
+
+
+class DconfStandIn:
+    """ca.desrt.dconf.Writer: sparar varje ändring och skickar Notify som dconf-service gör."""
+
+    def __init__(self):
+        self.changes = []
+
+    def __call__(self, connection, message):
+        from jeepney import DBusAddress, new_signal
+        assert message.header.fields[3] == 'Change', message.header.fields  # 3 = MEMBER
+        blob = bytes(message.body[0])
+        self.changes.append(blob)
+        tag = f"tag{len(self.changes)}"
+        address = DBusAddress('/ca/desrt/dconf/Writer/user', interface='ca.desrt.dconf.Writer')
+        # En annan klients ändring först; backenden ska vänta på sin egen tagg
+        connection.send(new_signal(address, 'Notify', 'sass', ('/other/', ['key'], 'annan')))
+        connection.send(new_signal(address, 'Notify', 'sass',
+                                   (DCONF_DIR, ['picture-uri', 'picture-uri-dark'], tag)))
+        return 's', (tag,)
+
+
+class PlasmaStandIn:
+    """org.kde.plasmashell: tolkar backendens skript för två skrivbord."""
+
+    def __init__(self):
+        self.images = ['', '']
+
+    def __call__(self, connection, message):
+        script = message.body[0]
+        match = re.search(r'var image = (.*);', script)
+        if match:
+            self.images = [json.loads(match.group(1))] * len(self.images)
+            return 's', ('',)
+        if 'readConfig("Image")' in script:
+            return 's', ('\n'.join(self.images),)
+        raise ValueError("okänt skript")
+
+
+def check_changeset_bytes():
+    from utils.wallpaper_backends import _dconf_changeset
+    assert _dconf_changeset({'/a/b': 'x'}) == GLIB_SINGLE
+    uri = 'file:///tmp/search%20wallpaper/bild.jpg'
+    assert _dconf_changeset({DCONF_DIR + 'picture-uri': uri, DCONF_DIR + 'picture-uri-dark': uri}) == GLIB_GNOME
+    wide = _dconf_changeset({DCONF_DIR + 'picture-uri': 'file:///tmp/' + 'a' * 300 + '.jpg', '/k': ''})
+    assert len(wide) == 393 and hashlib.sha256(wide).hexdigest() == GLIB_WIDE_SHA256
+
+
+def check_gnome_backend(dconf: DconfStandIn):
+    import utils.wallpaper_backends as backends
+    # Utan PyGObject används dconf över D-Bus; blockera gi om det råkar vara installerat
+    sys.modules['gi'] = None
+    os.environ['XDG_CURRENT_DESKTOP'] = 'ubuntu:GNOME'
+    backends._selected = None
+    backend = backends.get_backend()
+    assert backend is not None and backend.name == 'gnome', backend
+
+    started = time.perf_counter()
+    assert backend.apply(GNOME_IMAGE) is True
+    assert time.perf_counter() - started < 2.0
+    assert dconf.changes == [GLIB_GNOME], dconf.changes
+    # dconf kan inte läsas via D-Bus; set_wallpaper använder då sitt eget tillstånd
+    assert backend.current() is None
+
+
+def check_kde_backend(plasma: PlasmaStandIn):
+    import utils.wallpaper_backends as backends
+    os.environ['XDG_CURRENT_DESKTOP'] = 'KDE'
+    backends._selected = None
+    backend = backends.get_backend()
+    assert backend is not None and backend.name == 'kde', backend
+
+    # Citattecken i namnet får inte kunna bryta sig ut ur skriptet
+    path = '/tmp/search wallpaper/bild "1" \'2\'.jpg'
+    assert backend.apply(path) is True
+    assert plasma.images == ['file:///tmp/search%20wallpaper/bild%20%221%22%20%272%27.jpg'] * 2, plasma.images
+    assert backend.current() == path
+
+
+def main():
+    if os.environ.get(PRIVATE_BUS_FLAG) != '1':
+        # Kör alltid mot en egen buss, aldrig mot skrivbordets riktiga session
+        runner = shutil.which('dbus-run-session')
+        if runner is None:
+            print("dbus-run-session saknas, kan inte starta en privat sessionsbuss")
+            sys.exit(1)
+        os.environ[PRIVATE_BUS_FLAG] = '1'
+        os.execv(runner, [runner, '--', sys.executable, os.path.abspath(__file__)] + sys.argv[1:])
+
+    dconf, plasma = DconfStandIn(), PlasmaStandIn()
+    _serve('ca.desrt.dconf', dconf)
+    _serve('org.kde.plasmashell', plasma)
+
+    checks = [
+        ('check_changeset_bytes', check_changeset_bytes),
+        ('check_gnome_backend', lambda: check_gnome_backend(dconf)),
+        ('check_kde_backend', lambda: check_kde_backend(plasma)),
+    ]
+    failed = 0
+    for name, check in checks:
+        started = time.perf_counter()
+        try:
+            check()
+            print(f"OK    {name} ({time.perf_counter() - started:.2f} s)")
+        except Exception:
+            failed += 1
+            print(f"FEL   {name}")
+            traceback.print_exc()
+
+    print(f"{len(checks) - failed}/{len(checks)} kontroller godkända")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()